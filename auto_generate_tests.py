@@ -14,11 +14,19 @@
 
 import os
 import json
+import time
+import queue
 import argparse
+import threading
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import OpenAI
 
+from progress_events import EventLog, NullEventLog, EventClient
+from case_cache import CaseCache, CACHE_DIR
+
 # 任务生成的System Prompt
 TASK_GENERATION_PROMPT = """你是一个专业的软件测试工程师。你的任务是为网站/应用生成全面的功能测试用例。
 
@@ -123,6 +131,26 @@ def generate_test_cases(instruction: str, client: OpenAI, model: str) -> list:
         return []
 
 
+def load_or_generate_test_cases(instruction: str, client: OpenAI, model: str,
+                                cache: CaseCache = None, regenerate: bool = False) -> tuple:
+    """
+    先查测试用例缓存，未命中（或 regenerate=True）时调用LLM生成并写入缓存
+
+    Returns:
+        (测试用例列表, 是否命中缓存)
+    """
+    if cache is not None and not regenerate:
+        test_cases = cache.get(instruction, model)
+        if test_cases:
+            print(f"♻️ 命中测试用例缓存 ({len(test_cases)} 个用例)，跳过生成")
+            return test_cases, True
+
+    test_cases = generate_test_cases(instruction, client, model)
+    if cache is not None:
+        cache.put(instruction, model, test_cases)
+    return test_cases, False
+
+
 def run_single_test(test_case: dict, url: str, api_key: str, base_url: str,
                    model: str, output_dir: str, test_index: int) -> dict:
     """
@@ -205,20 +233,221 @@ def run_single_test(test_case: dict, url: str, api_key: str, base_url: str,
         }
 
     # 打印结果
-    result_emoji = {
-        "YES": "✅",
-        "PARTIAL": "⚠️",
-        "NO": "❌",
-        "TIMEOUT": "⏱️",
-        "ERROR": "🔥",
-        "UNKNOWN": "❓"
-    }
-    emoji = result_emoji.get(test_result['result'], "❓")
+    emoji = RESULT_EMOJI.get(test_result['result'], "❓")
     print(f"\n{emoji} 结果: {test_result['result']}")
 
     return test_result
 
 
+RESULT_EMOJI = {
+    "YES": "✅",
+    "PARTIAL": "⚠️",
+    "NO": "❌",
+    "TIMEOUT": "⏱️",
+    "ERROR": "🔥",
+    "UNKNOWN": "❓"
+}
+
+
+# 浏览器池复用driver前恢复的超时（秒），与Selenium默认值一致
+PAGE_LOAD_TIMEOUT = 300
+SCRIPT_TIMEOUT = 30
+
+
+class BrowserPool:
+    """
+    复用的Chrome实例池，供进程内并发执行测试用例
+
+    Selenium没有独立的browser context，因此每次借出前清空cookie、
+    localStorage/sessionStorage等站点数据并回到空白页，使测试用例之间互不影响。
+    """
+
+    def __init__(self, size: int, headless: bool = True):
+        self.size = size
+        self.headless = headless
+        self.idle = queue.Queue()
+        self.drivers = []
+        self.lock = threading.Lock()
+        # 每个借出的浏览器占一个名额；持有名额时要么有空闲浏览器，要么可以新建一个，
+        # 所以丢弃坏浏览器时归还名额就能唤醒等待者，由它创建替代的浏览器
+        self.slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, url: str):
+        self.slots.acquire()
+        try:
+            driver = self.idle.get_nowait()
+        except queue.Empty:
+            try:
+                from eval_single_website_openai import create_driver
+                driver = create_driver(self.headless)
+            except Exception:
+                self.slots.release()
+                raise
+            with self.lock:
+                self.drivers.append(driver)
+        self._reset(driver, url)
+        return driver
+
+    def _reset(self, driver, url: str):
+        try:
+            # run_evaluation 会按剩余时间设置页面加载超时，不能带到下一个用例
+            driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+            driver.set_script_timeout(SCRIPT_TIMEOUT)
+            parts = urlsplit(url)
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {
+                "origin": f"{parts.scheme}://{parts.netloc}",
+                "storageTypes": "all"
+            })
+            driver.delete_all_cookies()
+            driver.get("about:blank")
+        except Exception as e:
+            print(f"重置浏览器失败: {e}")
+
+    def release(self, driver, broken: bool = False):
+        if broken:
+            # 浏览器异常时丢弃，下次借用时重新创建
+            with self.lock:
+                self.drivers.remove(driver)
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        else:
+            self.idle.put(driver)
+        self.slots.release()
+
+    def close(self):
+        with self.lock:
+            for driver in self.drivers:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+            self.drivers = []
+
+
+def run_single_test_inprocess(test_case: dict, url: str, client: OpenAI, model: str,
+                              output_dir: str, test_index: int, pool: BrowserPool,
+                              timeout: float = 300, events=None, game=None) -> dict:
+    """
+    在当前进程内执行单个测试用例（直接调用评估函数，复用浏览器池）
+
+    Returns:
+        测试结果字典，格式与 run_single_test 相同
+    """
+    from eval_single_website_openai import run_evaluation
+    from eval_core import RESULT_TIMEOUT, RESULT_MAX_ITER, RESULT_API_ERROR
+
+    events = events or NullEventLog()
+    start_time = time.time()
+    events.emit('case_start', game=game, case=test_index)
+    print(f"\n▶ 开始测试 {test_index}: {test_case['task']}")
+    test_output_dir = os.path.join(output_dir, f"test_{test_index:02d}")
+    os.makedirs(test_output_dir, exist_ok=True)
+
+    driver = pool.acquire(url)
+    broken = False
+    try:
+        result = run_evaluation(
+            url=url,
+            task=test_case['task'],
+            expected=test_case['expected_result'],
+            api_key=None,
+            base_url=None,
+            model=model,
+            max_iter=15,
+            output_dir=test_output_dir,
+            driver=driver,
+            client=client,
+            timeout=timeout
+        )
+
+        result_file = os.path.join(test_output_dir, "result.json")
+        if result == RESULT_TIMEOUT:
+            test_result = {
+                "test_case": test_case,
+                "result": "TIMEOUT",
+                "error": f"Execution timeout ({timeout}s)",
+                "status": "timeout"
+            }
+        elif result in (RESULT_MAX_ITER, RESULT_API_ERROR):
+            test_result = {
+                "test_case": test_case,
+                "result": "ERROR",
+                "error": "Max iterations reached without an answer" if result == RESULT_MAX_ITER else "Model API call failed",
+                "status": "failed"
+            }
+        elif os.path.exists(result_file):
+            with open(result_file, 'r', encoding='utf-8') as f:
+                eval_result = json.load(f)
+
+            test_result = {
+                "test_case": test_case,
+                "result": eval_result.get("result", "UNKNOWN"),
+                "iterations": eval_result.get("iterations", 0),
+                "timestamp": eval_result.get("timestamp", ""),
+                "output_dir": test_output_dir,
+                "status": "completed"
+            }
+        else:
+            test_result = {
+                "test_case": test_case,
+                "result": "ERROR",
+                "error": "Result file not found",
+                "status": "failed"
+            }
+
+    except Exception as e:
+        broken = True
+        test_result = {
+            "test_case": test_case,
+            "result": "ERROR",
+            "error": str(e),
+            "status": "failed"
+        }
+    finally:
+        pool.release(driver, broken=broken)
+
+    emoji = RESULT_EMOJI.get(test_result['result'], "❓")
+    print(f"\n{emoji} 测试 {test_index} 结果: {test_result['result']}")
+    events.emit('case_done', game=game, case=test_index, result=test_result['result'],
+                latency=round(time.time() - start_time, 2))
+
+    return test_result
+
+
+def run_tests_concurrently(test_cases: list, url: str, client: OpenAI, model: str,
+                           output_dir: str, workers: int = 3, headless: bool = True,
+                           timeout: float = 300, events=None, game=None) -> list:
+    """
+    并发执行同一网站的所有测试用例，每完成一个就写入中间结果
+
+    Returns:
+        按测试序号排序的结果列表
+    """
+    pool = BrowserPool(size=max(workers, 1), headless=headless)
+    results = {}
+    intermediate_file = os.path.join(output_dir, "results_intermediate.json")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = {
+                executor.submit(run_single_test_inprocess, test_case, url, client, model,
+                                output_dir, i, pool, timeout, events, game): i
+                for i, test_case in enumerate(test_cases, 1)
+            }
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+
+                # 保存中间结果（防止中断）
+                with open(intermediate_file, 'w', encoding='utf-8') as f:
+                    json.dump([results[i] for i in sorted(results)], f, indent=2, ensure_ascii=False)
+    finally:
+        pool.close()
+
+    return [results[i] for i in sorted(results)]
+
+
 def generate_report(results: list, output_dir: str, instruction: str):
     """
     生成测试报告
@@ -327,6 +556,17 @@ def main():
     parser.add_argument("--output_dir", default="auto_test_results", help="输出目录")
     parser.add_argument("--skip_generation", action="store_true",
                        help="跳过测试用例生成，使用已有的test_cases.json")
+    parser.add_argument("--engine", choices=["inprocess", "subprocess"], default="inprocess",
+                       help="inprocess: 进程内并发执行；subprocess: 每个用例启动一个评估子进程（串行）")
+    parser.add_argument("--workers", type=int, default=3,
+                       help="进程内并发执行的测试用例数（浏览器池大小）")
+    parser.add_argument("--timeout", type=float, default=300, help="单个测试用例的超时秒数")
+    parser.add_argument("--cache_dir", default=CACHE_DIR, help="测试用例缓存目录")
+    parser.add_argument("--no_cache", action="store_true", help="不读写测试用例缓存")
+    parser.add_argument("--regenerate", action="store_true",
+                        help="忽略缓存重新生成测试用例，并用新结果覆盖缓存")
+    parser.add_argument("--event_log", default=None, help="进度事件日志路径（供 monitor_batch.py 读取）")
+    parser.add_argument("--game_id", type=int, default=None, help="写入事件日志的游戏编号")
 
     args = parser.parse_args()
 
@@ -336,6 +576,10 @@ def main():
 
     # 初始化OpenAI客户端
     client = OpenAI(api_key=args.api_key, base_url=args.base_url)
+    events = EventLog(args.event_log) if args.event_log else NullEventLog()
+    if args.event_log:
+        # 测试用例生成和进程内评估的LLM请求都写入 llm_start / llm_done（--engine subprocess 的评估子进程不计入）
+        client = EventClient(client, events)
 
     # 阶段1：生成测试用例
     test_cases_file = os.path.join(output_dir, "test_cases.json")
@@ -344,8 +588,16 @@ def main():
         print(f"使用已有的测试用例: {test_cases_file}")
         with open(test_cases_file, 'r', encoding='utf-8') as f:
             test_cases = json.load(f)
+        events.emit('generate_done', game=args.game_id, num_cases=len(test_cases), latency=0)
     else:
-        test_cases = generate_test_cases(args.instruction, client, args.model)
+        cache = None if args.no_cache else CaseCache(args.cache_dir, TASK_GENERATION_PROMPT)
+        events.emit('generate_start', game=args.game_id)
+        generate_start = time.time()
+        test_cases, cached = load_or_generate_test_cases(
+            args.instruction, client, args.model, cache, args.regenerate
+        )
+        events.emit('generate_done', game=args.game_id, num_cases=len(test_cases),
+                    latency=0 if cached else round(time.time() - generate_start, 2), cached=cached)
 
         if not test_cases:
             print("❌ 无法生成测试用例，退出")
@@ -357,12 +609,33 @@ def main():
         print(f"\n测试用例已保存至: {test_cases_file}")
 
     # 阶段2：执行测试用例
+    if args.engine == "inprocess":
+        print("\n" + "=" * 70)
+        print(f"阶段2：并发执行测试用例（{args.workers} 个浏览器）")
+        print("=" * 70)
+
+        results = run_tests_concurrently(
+            test_cases=test_cases,
+            url=args.url,
+            client=client,
+            model=args.model,
+            output_dir=output_dir,
+            workers=args.workers,
+            timeout=args.timeout,
+            events=events,
+            game=args.game_id
+        )
+        generate_report(results, output_dir, args.instruction)
+        return
+
     print("\n" + "=" * 70)
     print("阶段2：逐个执行测试用例")
     print("=" * 70)
 
     results = []
     for i, test_case in enumerate(test_cases, 1):
+        events.emit('case_start', game=args.game_id, case=i)
+        case_start = time.time()
         result = run_single_test(
             test_case=test_case,
             url=args.url,
@@ -372,6 +645,8 @@ def main():
             output_dir=output_dir,
             test_index=i
         )
+        events.emit('case_done', game=args.game_id, case=i, result=result['result'],
+                    latency=round(time.time() - case_start, 2))
         results.append(result)
 
         # 保存中间结果（防止中断）
@@ -2,15 +2,27 @@
 """
 批量并发测试脚本
 从test_games目录并发测试10个游戏
+
+默认使用单进程调度器（--mode orchestrator）：一个HTTP服务器提供所有游戏页面，
+所有 (游戏, 测试用例) 放入同一个全局队列，浏览器并发数和LLM调用并发数分别限制。
+--mode subprocess 为原来的每个游戏一个 auto_generate_tests.py 子进程的方式。
 """
 
 import os
 import json
+import argparse
 import subprocess
+import threading
 import time
+from functools import partial
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+from progress_events import EventLog, NullEventLog, EventClient
+from case_cache import CACHE_DIR  # 测试用例缓存，调度器和子进程模式共用
+
 # 配置
 JSON_FILE = 'artifacts_data_gemini_query_on_game_1210_cleaned.json'
 TEST_GAMES_DIR = 'test_games'
@@ -20,6 +32,11 @@ BASE_URL = 'http://wanqing.internal/api/agent/v1/apps'
 MODEL = 'app-wcy0kf-1764751667098941604'
 BASE_PORT = 9000  # 起始端口
 MAX_WORKERS = 5   # 并发数量（建议不要太高，避免API限流）
+WORKERS_PER_GAME = 2  # 每个游戏内并发执行的测试用例数（浏览器数）
+MAX_BROWSERS = 8      # 调度器模式：同时打开的浏览器数
+MAX_LLM_CALLS = 6     # 调度器模式：同时进行的LLM请求数（测试生成 + 评估）
+GAME_TIMEOUT = 1800   # 单个游戏的时限（秒），子进程模式的超时；调度器模式默认总时限为 游戏数 × 该值
+EVENT_LOG = os.path.join(RESULTS_DIR, 'events.jsonl')  # 进度事件日志，monitor_batch.py 增量读取
 
 def load_game_data():
     """加载游戏数据"""
@@ -60,7 +77,7 @@ def start_http_server(port, directory):
     time.sleep(2)  # 等待服务器启动
     return process
 
-def test_single_game(game_info, port):
+def test_single_game(game_info, port, regenerate=False):
     """测试单个游戏"""
     index = game_info['index']
     filename = game_info['filename']
@@ -86,8 +103,14 @@ def test_single_game(game_info, port):
         '--api_key', API_KEY,
         '--base_url', BASE_URL,
         '--model', MODEL,
-        '--output_dir', output_dir
+        '--output_dir', output_dir,
+        '--workers', str(WORKERS_PER_GAME),
+        '--event_log', EVENT_LOG,
+        '--game_id', str(index),
+        '--cache_dir', CACHE_DIR
     ]
+    if regenerate:
+        cmd.append('--regenerate')
 
     try:
         start_time = time.time()
@@ -97,7 +120,7 @@ def test_single_game(game_info, port):
             cmd,
             capture_output=True,
             text=True,
-            timeout=1800  # 30分钟超时
+            timeout=GAME_TIMEOUT
         )
 
         elapsed = time.time() - start_time
@@ -140,7 +163,7 @@ def test_single_game(game_info, port):
             'filename': filename,
             'status': 'TIMEOUT',
             'message': '测试超时',
-            'elapsed': 1800,
+            'elapsed': GAME_TIMEOUT,
             'output_dir': output_dir
         }
     except Exception as e:
@@ -153,6 +176,194 @@ def test_single_game(game_info, port):
             'output_dir': output_dir
         }
 
+class _LimitedCompletions:
+
+    def __init__(self, completions, semaphore):
+        self.completions = completions
+        self.semaphore = semaphore
+
+    def create(self, **kwargs):
+        with self.semaphore:
+            return self.completions.create(**kwargs)
+
+
+class LimitedClient:
+    """OpenAI客户端包装：所有 chat.completions.create 调用共享一个并发上限"""
+
+    def __init__(self, client, max_concurrent, events=None):
+        semaphore = threading.BoundedSemaphore(max_concurrent)
+        # 事件在拿到并发名额之后才写，进行中的LLM请求数即实际在跑的请求数
+        client = EventClient(client, events or NullEventLog())
+        self.chat = SimpleNamespace(completions=_LimitedCompletions(client.chat.completions, semaphore))
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_inprocess_server(port, directory):
+    """在后台线程中启动HTTP服务器，返回时端口已可用"""
+    server = ThreadingHTTPServer(('', port), partial(QuietHandler, directory=directory))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Orchestrator:
+    """
+    单进程批量测试调度器
+
+    测试用例生成在 LLM 线程池中进行，每个游戏生成完毕后其测试用例立即进入
+    全局执行队列（浏览器线程池），不必等待其他游戏。每个游戏的所有用例完成后
+    写出该游戏的 test_report，返回格式与 test_single_game 相同。
+    """
+
+    def __init__(self, games, port, client, max_browsers, max_llm_calls, timeout=300, events=None,
+                 cache=None, regenerate=False, batch_timeout=None):
+        from auto_generate_tests import BrowserPool
+
+        self.games = games
+        self.port = port
+        self.events = events or NullEventLog()
+        self.client = LimitedClient(client, max_llm_calls, self.events)
+        self.cache = cache
+        self.regenerate = regenerate
+        self.max_llm_calls = max_llm_calls
+        self.timeout = timeout
+        # 整批的时限：超时后未完成的游戏记为 TIMEOUT，run() 不会无限等待
+        self.batch_timeout = batch_timeout if batch_timeout is not None else GAME_TIMEOUT * len(games)
+        self.pool = BrowserPool(size=max_browsers)
+        self.executor = ThreadPoolExecutor(max_workers=max_browsers)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.results = []
+        self.finished = set()
+        self.done = threading.Event()
+
+    def _game_dir(self, game):
+        return os.path.join(RESULTS_DIR, f"game_{game['index']:03d}")
+
+    def _finish_game(self, game, status, message, test_results=None):
+        """记录一个游戏的最终状态，每个游戏只记录第一次"""
+        from auto_generate_tests import generate_report
+
+        with self.lock:
+            if game['index'] in self.finished:
+                return
+            self.finished.add(game['index'])
+
+        output_dir = self._game_dir(game)
+        if test_results:
+            try:
+                generate_report(test_results, output_dir, game['question'])
+            except Exception as e:
+                status, message = 'ERROR', f"生成报告失败: {e}"
+        elapsed = time.time() - game.get('start_time', time.time())
+        print(f"[{game['index']}] {status}: {message} (耗时: {elapsed:.1f}s)")
+        self.events.emit('game_done', game=game['index'], status=status)
+        with self.lock:
+            self.results.append({
+                'index': game['index'],
+                'filename': game['filename'],
+                'status': status,
+                'message': message,
+                'elapsed': elapsed,
+                'output_dir': output_dir
+            })
+            if len(self.results) == len(self.games):
+                self.done.set()
+
+    def _start_game(self, game):
+        try:
+            self._generate(game)
+        except Exception as e:
+            self._finish_game(game, 'ERROR', f"生成测试用例出错: {e}")
+
+    def _generate(self, game):
+        from auto_generate_tests import load_or_generate_test_cases
+
+        game['start_time'] = time.time()
+        output_dir = self._game_dir(game)
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, 'question.txt'), 'w', encoding='utf-8') as f:
+            f.write(game['question'])
+
+        print(f"[{game['index']}] 开始生成测试用例: {game['filename']}")
+        self.events.emit('generate_start', game=game['index'])
+        test_cases, cached = load_or_generate_test_cases(
+            game['question'], self.client, MODEL, self.cache, self.regenerate
+        )
+        self.events.emit('generate_done', game=game['index'], num_cases=len(test_cases),
+                         latency=0 if cached else round(time.time() - game['start_time'], 2),
+                         cached=cached)
+        if not test_cases:
+            self._finish_game(game, 'FAILED', '无法生成测试用例')
+            return
+
+        with open(os.path.join(output_dir, 'test_cases.json'), 'w', encoding='utf-8') as f:
+            json.dump(test_cases, f, indent=2, ensure_ascii=False)
+
+        with self.lock:
+            if game['index'] in self.finished:  # 生成期间整批已超时
+                return
+            self.pending[game['index']] = {'total': len(test_cases), 'results': {}}
+        url = f"http://localhost:{self.port}/{game['filename']}"
+        for i, test_case in enumerate(test_cases, 1):
+            self.executor.submit(self._run_case, game, url, i, test_case)
+
+    def _run_case(self, game, url, test_index, test_case):
+        from auto_generate_tests import run_single_test_inprocess
+
+        if game['index'] in self.finished:  # 游戏已因出错或超时结束，剩下的用例不再执行
+            return
+        try:
+            result = run_single_test_inprocess(
+                test_case, url, self.client, MODEL, self._game_dir(game),
+                test_index, self.pool, self.timeout, self.events, game['index']
+            )
+        except Exception as e:
+            result = {"test_case": test_case, "result": "ERROR", "error": str(e), "status": "failed"}
+
+        try:
+            with self.lock:
+                state = self.pending[game['index']]
+                state['results'][test_index] = result
+                finished = len(state['results']) == state['total']
+                ordered = [state['results'][i] for i in sorted(state['results'])]
+                with open(os.path.join(self._game_dir(game), 'results_intermediate.json'), 'w', encoding='utf-8') as f:
+                    json.dump(ordered, f, indent=2, ensure_ascii=False)
+
+            if finished:
+                yes = sum(1 for r in ordered if r.get('result') == 'YES')
+                partial_count = sum(1 for r in ordered if r.get('result') == 'PARTIAL')
+                no = sum(1 for r in ordered if r.get('result') == 'NO')
+                self._finish_game(game, 'SUCCESS', f"完成 - YES:{yes} PARTIAL:{partial_count} NO:{no}", ordered)
+        except Exception as e:
+            # 执行器里的异常没人读取，不处理的话该游戏永远不会结束
+            self._finish_game(game, 'ERROR', f"记录测试结果出错: {e}")
+
+    def run(self):
+        if not self.games:
+            return []
+        self.events.emit('batch_start', games=len(self.games))
+        generators = ThreadPoolExecutor(max_workers=self.max_llm_calls)
+        try:
+            for game in self.games:
+                generators.submit(self._start_game, game)
+            if not self.done.wait(self.batch_timeout):
+                print(f"批量测试超过时限 {self.batch_timeout:.0f}s，未完成的游戏记为 TIMEOUT")
+                for game in self.games:
+                    self._finish_game(game, 'TIMEOUT', '超过批量测试时限')
+        finally:
+            generators.shutdown(wait=True, cancel_futures=True)
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.pool.close()
+            self.events.emit('batch_done')
+        return self.results
+
+
 def generate_summary_report(results):
     """生成总结报告"""
     print("\n" + "="*70)
@@ -281,7 +492,54 @@ def generate_summary_report(results):
 
     print(f"Markdown报告已保存: {md_file}")
 
+def run_orchestrator(games, args):
+    """单进程调度：一个HTTP服务器 + 全局测试用例队列"""
+    from openai import OpenAI
+    from auto_generate_tests import TASK_GENERATION_PROMPT
+    from case_cache import CaseCache
+
+    print(f"\n启动HTTP服务器 (端口 {BASE_PORT})...")
+    server = start_inprocess_server(BASE_PORT, TEST_GAMES_DIR)
+
+    try:
+        print(f"\n开始调度测试 (浏览器并发: {args.max_browsers}, LLM并发: {args.max_llm_calls})...")
+        print("="*70)
+
+        client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+        orchestrator = Orchestrator(
+            games, BASE_PORT, client,
+            max_browsers=args.max_browsers,
+            max_llm_calls=args.max_llm_calls,
+            timeout=args.timeout,
+            events=EventLog(EVENT_LOG),
+            cache=CaseCache(CACHE_DIR, TASK_GENERATION_PROMPT),
+            regenerate=args.regenerate,
+            batch_timeout=args.batch_timeout
+        )
+        results = orchestrator.run()
+
+        generate_summary_report(results)
+
+    finally:
+        print("\n关闭HTTP服务器...")
+        server.shutdown()
+        server.server_close()
+        print("完成！")
+
+
 def main():
+    parser = argparse.ArgumentParser(description="批量并发游戏测试")
+    parser.add_argument("--mode", choices=["orchestrator", "subprocess"], default="orchestrator",
+                        help="orchestrator: 单进程全局调度；subprocess: 每个游戏一个 auto_generate_tests.py 子进程")
+    parser.add_argument("--max_browsers", type=int, default=MAX_BROWSERS, help="同时打开的浏览器数")
+    parser.add_argument("--max_llm_calls", type=int, default=MAX_LLM_CALLS, help="同时进行的LLM请求数")
+    parser.add_argument("--timeout", type=float, default=300, help="单个测试用例的超时秒数")
+    parser.add_argument("--batch_timeout", type=float, default=None,
+                        help=f"调度器模式整批的超时秒数（默认 游戏数 × {GAME_TIMEOUT}）")
+    parser.add_argument("--regenerate", action="store_true",
+                        help="忽略测试用例缓存重新生成（新结果会覆盖缓存）")
+    args = parser.parse_args()
+
     print("="*70)
     print("批量并发游戏测试")
     print("="*70)
@@ -297,6 +555,10 @@ def main():
     for i, game in enumerate(games):
         print(f"  {i+1}. Game {game['index']:03d}: {game['filename']}")
 
+    if args.mode == "orchestrator":
+        run_orchestrator(games, args)
+        return
+
     # 启动HTTP服务器
     print(f"\n启动HTTP服务器 (端口 {BASE_PORT})...")
     server_process = start_http_server(BASE_PORT, TEST_GAMES_DIR)
@@ -306,11 +568,14 @@ def main():
         print(f"\n开始并发测试 (最大并发数: {MAX_WORKERS})...")
         print("="*70)
 
+        events = EventLog(EVENT_LOG)
+        events.emit('batch_start', games=len(games))
+
         results = []
         with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
             # 提交所有任务
             future_to_game = {
-                executor.submit(test_single_game, game, BASE_PORT): game
+                executor.submit(test_single_game, game, BASE_PORT, args.regenerate): game
                 for game in games
             }
 
@@ -318,6 +583,8 @@ def main():
             for future in as_completed(future_to_game):
                 result = future.result()
                 results.append(result)
+                events.emit('game_done', game=result['index'], status=result['status'])
+        events.emit('batch_done')
 
         # 生成报告
         generate_summary_report(results)
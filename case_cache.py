@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+LLM生成测试用例的缓存
+
+同一个网站描述 + 同一个模型只生成一次测试用例，之后的运行（例如重新测试同一游戏的新版本）
+直接复用，既省去阶段1的LLM调用，也保证前后两次测试结果可比。
+
+缓存键为 sha256(网站描述 + 模型 + 生成提示词)，修改 TASK_GENERATION_PROMPT 后旧条目自动失效。
+每个条目是 <cache_dir>/<key>.json。
+
+使用方法:
+    python case_cache.py --list
+    python case_cache.py --invalidate --instruction "..." --model "..."
+    python case_cache.py --clear
+"""
+
+import os
+import json
+import hashlib
+import argparse
+from datetime import datetime
+
+CACHE_DIR = 'test_case_cache'
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class CaseCache:
+    """按 (网站描述, 模型) 缓存测试用例列表"""
+
+    def __init__(self, cache_dir=CACHE_DIR, prompt=''):
+        self.cache_dir = cache_dir
+        self.prompt_hash = _sha256(prompt)[:16]
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, instruction, model):
+        payload = json.dumps([instruction.strip(), model, self.prompt_hash], ensure_ascii=False)
+        return _sha256(payload)
+
+    def _path(self, instruction, model):
+        return os.path.join(self.cache_dir, f"{self.key(instruction, model)}.json")
+
+    def get(self, instruction, model):
+        """命中时返回测试用例列表，否则返回 None"""
+        path = self._path(instruction, model)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry.get('test_cases') or None
+
+    def put(self, instruction, model, test_cases):
+        if not test_cases:
+            return  # 生成失败不缓存
+        entry = {
+            'instruction': instruction,
+            'model': model,
+            'prompt_hash': self.prompt_hash,
+            'created': datetime.now().isoformat(),
+            'test_cases': test_cases
+        }
+        path = self._path(instruction, model)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)  # 多个进程同时写同一条目也不会读到半个文件
+
+    def invalidate(self, instruction, model):
+        """删除一个条目，返回是否存在"""
+        try:
+            os.remove(self._path(instruction, model))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def clear(self):
+        """删除所有条目，返回删除的数量"""
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.cache_dir, name))
+                removed += 1
+        return removed
+
+    def entries(self):
+        for name in sorted(os.listdir(self.cache_dir)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.cache_dir, name), 'r', encoding='utf-8') as f:
+                    yield name[:-len('.json')], json.load(f)
+
+
+def main():
+    from auto_generate_tests import TASK_GENERATION_PROMPT
+
+    parser = argparse.ArgumentParser(description="管理测试用例缓存")
+    parser.add_argument("--cache_dir", default=CACHE_DIR, help="缓存目录")
+    parser.add_argument("--list", action="store_true", help="列出缓存条目")
+    parser.add_argument("--invalidate", action="store_true", help="删除 --instruction/--model 对应的条目")
+    parser.add_argument("--clear", action="store_true", help="删除所有条目")
+    parser.add_argument("--instruction", help="网站功能描述")
+    parser.add_argument("--model", help="模型名称")
+    args = parser.parse_args()
+
+    cache = CaseCache(args.cache_dir, TASK_GENERATION_PROMPT)
+
+    if args.clear:
+        print(f"已删除 {cache.clear()} 个缓存条目")
+    elif args.invalidate:
+        if not args.instruction or not args.model:
+            parser.error("--invalidate 需要 --instruction 和 --model")
+        if cache.invalidate(args.instruction, args.model):
+            print("已删除缓存条目")
+        else:
+            print("缓存中没有该条目")
+    else:
+        for key, entry in cache.entries():
+            stale = "" if entry.get('prompt_hash') == cache.prompt_hash else " (提示词已变更，不再命中)"
+            print(f"{key[:12]}  {entry.get('created', '')[:19]}  {entry.get('model')}  "
+                  f"{len(entry.get('test_cases', []))}个用例  {entry.get('instruction', '')[:40]!r}{stale}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+网站评估核心 - eval_single_website.py (Claude) 和 eval_single_website_openai.py (OpenAI 兼容 API) 共用
+
+两个脚本只负责创建各自的API客户端和模型后端，截图标注、动作解析与执行、等待和交互循环都在这里，
+优化一处即可同时作用于两个入口。
+
+模型后端需要提供:
+    name                       打印用的名称
+    image_block(img_b64)       截图在该API消息格式中的内容块
+    complete(messages, system, timeout=None)
+                               返回模型回复文本，失败返回 None；timeout 为本次调用（含重试）的秒数上限
+"""
+
+import os
+import re
+import time
+import json
+import base64
+from datetime import datetime
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import WebDriverException, StaleElementReferenceException, TimeoutException
+
+
+# ============== 配置 ==============
+
+SYSTEM_PROMPT = """你是一个专业的网页测试机器人。你需要完成一个测试任务来验证网站功能。
+
+在每次迭代中，你会收到一张网页截图。截图中每个可交互元素的左上角都有一个红色数字标签。
+
+可用的操作:
+1. Click [数字标签] - 点击元素
+2. Type [数字标签]; [内容] - 在输入框中输入内容
+3. Scroll [数字标签 或 WINDOW]; [up 或 down] - 滚动页面或元素
+4. KeyPress [按键] - 按下键盘按键（如 ArrowUp, ArrowDown, ArrowLeft, ArrowRight, r, Enter 等）
+5. Wait - 等待5秒
+6. GoBack - 返回上一页
+7. ANSWER; [YES/NO/PARTIAL] - 给出测试结果
+
+重要规则:
+- 每次只执行一个操作
+- 仔细观察截图，确保选择正确的元素标签
+- 不要重复相同的无效操作
+- 最多15次交互后必须用 ANSWER 给出最终判定
+- 对于游戏类网站，可以用 KeyPress 来测试键盘控制
+
+回复格式（必须严格遵守）:
+Thought: {你的分析思路}
+Action: {选择的操作}
+"""
+
+INIT_PROMPT = """
+测试任务: {task}
+
+期望结果: {expected}
+
+说明:
+- 像真实用户一样操作网页来测试功能
+- 仔细观察每次操作后的变化
+- 最多交互15次后必须给出答案
+
+完成测试后，用以下格式回答:
+- ANSWER; YES - 完全达到期望结果
+- ANSWER; NO - 完全未达到
+- ANSWER; PARTIAL - 部分达到
+"""
+
+# 标注元素并直接返回元素句柄：标签序号与返回列表下标一一对应，只需一次往返
+MARK_ELEMENTS_JS = """
+document.querySelectorAll('.webvoyager-label').forEach(el => el.remove());
+
+const elements = document.querySelectorAll('a, button, input, textarea, select, [onclick], [role="button"], [tabindex]');
+const marked = [];
+
+elements.forEach((el) => {
+    const rect = el.getBoundingClientRect();
+    if (rect.width > 0 && rect.height > 0 && rect.top >= 0 && rect.left >= 0 && rect.top < window.innerHeight) {
+        const label = document.createElement('div');
+        label.className = 'webvoyager-label';
+        label.textContent = marked.length;
+        label.style.cssText = `
+            position: fixed;
+            top: ${rect.top}px;
+            left: ${rect.left}px;
+            background: red;
+            color: white;
+            font-size: 12px;
+            font-weight: bold;
+            padding: 2px 4px;
+            z-index: 999999;
+            pointer-events: none;
+            border-radius: 3px;
+        `;
+        document.body.appendChild(label);
+        marked.push({
+            idx: marked.length,
+            element: el,
+            tag: el.tagName,
+            text: (el.textContent || el.value || '').slice(0, 30).trim(),
+            x: rect.left + rect.width / 2,
+            y: rect.top + rect.height / 2
+        });
+    }
+});
+
+return marked;
+"""
+
+# 等待页面稳定：readyState 为 complete 且 DOM 在 quiet 毫秒内没有变化，最多等待 timeout 毫秒
+SETTLE_JS = """
+const [quietMs, timeoutMs, done] = arguments;
+const start = performance.now();
+let last = start;
+const observer = new MutationObserver(() => { last = performance.now(); });
+observer.observe(document.documentElement, {subtree: true, childList: true, attributes: true, characterData: true});
+(function check() {
+    const now = performance.now();
+    if ((document.readyState === 'complete' && now - last >= quietMs) || now - start >= timeoutMs) {
+        observer.disconnect();
+        done(now - start);
+    } else {
+        setTimeout(check, 50);
+    }
+})();
+"""
+
+# 未得到 YES/NO/PARTIAL 时 evaluate 的返回值
+RESULT_TIMEOUT = "TIMEOUT"      # 超过整个评估的时间上限
+RESULT_MAX_ITER = "MAX_ITER"    # 用完 max_iter 次交互仍未给出答案
+RESULT_API_ERROR = "API_ERROR"  # 模型API调用失败（重试后仍失败）
+
+KEY_MAP = {
+    'arrowup': Keys.ARROW_UP,
+    'arrowdown': Keys.ARROW_DOWN,
+    'arrowleft': Keys.ARROW_LEFT,
+    'arrowright': Keys.ARROW_RIGHT,
+    'enter': Keys.ENTER,
+    'space': Keys.SPACE,
+    'escape': Keys.ESCAPE,
+    'tab': Keys.TAB,
+}
+
+
+# ============== 浏览器 ==============
+
+def create_driver(headless: bool = False):
+    """创建Chrome实例"""
+    options = Options()
+    options.add_argument("--window-size=1280,900")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-gpu")
+    if headless:
+        options.add_argument("--headless=new")
+
+    return webdriver.Chrome(options=options)
+
+
+def wait_for_settle(driver, timeout: float = 2.0, quiet: float = 0.3):
+    """等待页面加载完成且DOM停止变化（代替固定的 sleep），最多 timeout 秒"""
+    try:
+        driver.execute_async_script(SETTLE_JS, int(quiet * 1000), int(timeout * 1000))
+    except WebDriverException:
+        # 脚本执行期间发生了页面跳转，等新页面加载完成即可
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if driver.execute_script("return document.readyState") == "complete":
+                    return
+            except WebDriverException:
+                pass
+            time.sleep(0.1)
+
+
+def get_web_elements(driver) -> tuple:
+    """获取网页上的可交互元素并添加数字标签，返回 (元素句柄列表, 元素描述, 元素信息)"""
+    marked = driver.execute_script(MARK_ELEMENTS_JS)
+    elements = [m['element'] for m in marked]
+
+    # 生成元素描述
+    text_info = "页面可交互元素:\n"
+    for m in marked[:40]:  # 只显示前40个
+        text_info += f"[{m['idx']}] <{m['tag'].lower()}> {m['text']}\n"
+
+    return elements, text_info, marked
+
+
+def remove_labels(driver):
+    """移除页面上的标签"""
+    driver.execute_script("document.querySelectorAll('.webvoyager-label').forEach(el => el.remove());")
+
+
+def screenshot(driver, path: str) -> str:
+    """保存截图并返回base64编码（不再从磁盘读回）"""
+    png = driver.get_screenshot_as_png()
+    with open(path, "wb") as f:
+        f.write(png)
+    return base64.standard_b64encode(png).decode("utf-8")
+
+
+# ============== 动作 ==============
+
+def parse_action(response: str) -> tuple:
+    """解析模型返回的动作"""
+    # 提取Action部分
+    action_match = re.search(r'Action:\s*(.+)', response, re.IGNORECASE)
+    if not action_match:
+        return None, None
+
+    action = action_match.group(1).strip()
+
+    # 解析不同类型的动作
+    if action.upper().startswith('CLICK'):
+        match = re.search(r'\[(\d+)\]', action)
+        if match:
+            return 'click', int(match.group(1))
+
+    elif action.upper().startswith('TYPE'):
+        match = re.search(r'\[(\d+)\];\s*(.+)', action)
+        if match:
+            return 'type', {'idx': int(match.group(1)), 'content': match.group(2)}
+
+    elif action.upper().startswith('SCROLL'):
+        match = re.search(r'\[(\w+)\];\s*(up|down)', action, re.IGNORECASE)
+        if match:
+            return 'scroll', {'target': match.group(1), 'direction': match.group(2).lower()}
+
+    elif action.upper().startswith('KEYPRESS'):
+        match = re.search(r'KEYPRESS\s+(\w+)', action, re.IGNORECASE)
+        if match:
+            return 'keypress', match.group(1)
+
+    elif action.upper().startswith('WAIT'):
+        return 'wait', None
+
+    elif action.upper().startswith('GOBACK'):
+        return 'goback', None
+
+    elif action.upper().startswith('ANSWER'):
+        match = re.search(r'ANSWER;\s*(YES|NO|PARTIAL)', action, re.IGNORECASE)
+        if match:
+            return 'answer', match.group(1).upper()
+
+    return None, None
+
+
+def _click(driver, idx: int, elements: list, marked: list) -> bool:
+    try:
+        elements[idx].click()
+    except StaleElementReferenceException:
+        # 模型思考期间元素被重新渲染，按标注时的位置点击
+        if not driver.execute_script(
+                "const el = document.elementFromPoint(arguments[0], arguments[1]);"
+                "if (el) { el.click(); return true; } return false;",
+                marked[idx]['x'], marked[idx]['y']):
+            return False
+    return True
+
+
+def execute_action(driver, action_type: str, action_data, elements: list, marked: list = None):
+    """执行动作；elements 为 get_web_elements 返回的句柄，下标即标签序号"""
+    try:
+        if action_type == 'click':
+            idx = action_data
+            if idx < len(elements) and _click(driver, idx, elements, marked):
+                wait_for_settle(driver)
+                return True
+
+        elif action_type == 'type':
+            idx = action_data['idx']
+            content = action_data['content']
+            if idx < len(elements):
+                el = elements[idx]
+                el.clear()
+                el.send_keys(content)
+                el.send_keys(Keys.ENTER)
+                wait_for_settle(driver)
+                return True
+
+        elif action_type == 'scroll':
+            direction = action_data['direction']
+            delta = 500 if direction == 'down' else -500
+            driver.execute_script(f"window.scrollBy(0, {delta});")
+            wait_for_settle(driver, timeout=1.0)
+            return True
+
+        elif action_type == 'keypress':
+            key = action_data.lower()
+            ActionChains(driver).send_keys(KEY_MAP.get(key, key)).perform()
+            wait_for_settle(driver, timeout=1.0)
+            return True
+
+        elif action_type == 'wait':
+            # 模型明确要求等待（例如等计时器或动画），保持固定时长
+            time.sleep(5)
+            return True
+
+        elif action_type == 'goback':
+            driver.back()
+            wait_for_settle(driver, timeout=3.0)
+            return True
+
+    except Exception as e:
+        print(f"执行动作失败: {e}")
+
+    return False
+
+
+# ============== 模型后端 ==============
+
+class OpenAIBackend:
+    """OpenAI 兼容 API"""
+
+    def __init__(self, client, model: str, max_retries: int = 3, min_interval: float = 2.0):
+        self.client = client
+        self.model = model
+        self.name = model
+        self.max_retries = max_retries
+        self.min_interval = min_interval  # 两次请求的最小间隔，避免 RPM 限制
+        self.last_call = 0.0
+
+    def image_block(self, img_b64: str) -> dict:
+        return {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_b64}"}}
+
+    def complete(self, messages: list, system: str, timeout: float = None) -> str:
+        """调用 OpenAI 兼容 API，带重试机制"""
+        deadline = time.time() + timeout if timeout else None
+        # 截图和执行动作的时间也计入间隔，只补足剩余部分
+        wait = self.last_call + self.min_interval - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+        full_messages = [{"role": "system", "content": system}] + messages
+        try:
+            for attempt in range(self.max_retries):
+                request_args = {}
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    request_args["timeout"] = remaining
+                try:
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=full_messages,
+                        # max_tokens=1000,  # 不设置max_tokens，某些API设置后会返回None
+                        **request_args
+                    )
+                    content = response.choices[0].message.content
+                    if content is None:
+                        raise ValueError("API返回content为None")
+                    return content
+                except Exception as e:
+                    print(f"API调用失败 (尝试 {attempt + 1}/{self.max_retries}): {e}")
+                    if attempt < self.max_retries - 1:
+                        wait_time = (attempt + 1) * 5  # 递增等待时间
+                        if deadline is not None and time.time() + wait_time >= deadline:
+                            return None
+                        print(f"等待 {wait_time} 秒后重试...")
+                        time.sleep(wait_time)
+            return None
+        finally:
+            self.last_call = time.time()
+
+
+class AnthropicBackend:
+    """Anthropic Claude API"""
+
+    def __init__(self, client, model: str = "claude-sonnet-4-20250514", max_tokens: int = 1000):
+        self.client = client
+        self.model = model
+        self.name = "Claude"
+        self.max_tokens = max_tokens
+
+    def image_block(self, img_b64: str) -> dict:
+        return {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": img_b64}}
+
+    def complete(self, messages: list, system: str, timeout: float = None) -> str:
+        """调用Claude API"""
+        request_args = {"timeout": timeout} if timeout else {}
+        try:
+            response = self.client.messages.create(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                system=system,
+                messages=messages,
+                **request_args
+            )
+            return response.content[0].text
+        except Exception as e:
+            print(f"API调用失败: {e}")
+            return None
+
+
+# ============== 评估循环 ==============
+
+def evaluate(driver, backend, url: str, task: str, expected: str, max_iter: int = 15,
+             output_dir: str = "eval_results", timeout: float = None) -> str:
+    """
+    在已有的 driver 上运行一次评估，返回 YES/NO/PARTIAL，
+    或 RESULT_TIMEOUT / RESULT_MAX_ITER / RESULT_API_ERROR
+
+    timeout 为整个评估的秒数上限：页面加载和模型请求的超时都由剩余时间决定，
+    卡住的 driver.get 或API调用不会超出上限。结果写入 output_dir 下的 result.json 和 detailed_result.json。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    deadline = time.time() + timeout if timeout else None
+
+    def remaining():
+        return deadline - time.time() if deadline is not None else None
+
+    # 打开网页
+    print(f"正在打开: {url}")
+    if deadline is not None:
+        # 点击等动作触发的页面跳转同样受此限制
+        driver.set_page_load_timeout(max(remaining(), 1))
+    try:
+        driver.get(url)
+    except TimeoutException:
+        print(f"\n页面加载超时 ({timeout}s)")
+        return RESULT_TIMEOUT
+    wait_for_settle(driver, timeout=3.0)
+
+    # 点击页面以获取焦点（对于游戏很重要）
+    try:
+        driver.find_element(By.TAG_NAME, "body").click()
+    except:
+        pass
+
+    init_prompt = INIT_PROMPT.format(task=task, expected=expected)
+    messages = []
+    interaction_history = []  # 保存详细交互历史
+
+    for iteration in range(1, max_iter + 1):
+        if deadline is not None and time.time() > deadline:
+            print(f"\n评估超时 ({timeout}s)")
+            return RESULT_TIMEOUT
+
+        print(f"\n{'='*50}")
+        print(f"迭代 {iteration}/{max_iter}")
+        print('='*50)
+
+        # 获取元素并截图
+        elements, text_info, marked = get_web_elements(driver)
+        screenshot_path = os.path.join(output_dir, f"screenshot_{iteration}.png")
+        img_b64 = screenshot(driver, screenshot_path)
+        print(f"截图保存到: {screenshot_path}")
+
+        # 构建消息
+        if iteration == 1:
+            text = init_prompt + "\n\n" + text_info
+        else:
+            text = f"操作已执行。请观察当前截图，分析结果并决定下一步。\n\n{text_info}"
+        messages.append({"role": "user", "content": [
+            {"type": "text", "text": text},
+            backend.image_block(img_b64)
+        ]})
+
+        # 只保留最近几轮对话，避免token过多
+        if len(messages) > 6:
+            messages = messages[-6:]
+
+        print(f"调用 {backend.name} API...")
+        response = backend.complete(messages, SYSTEM_PROMPT, timeout=remaining())
+
+        if not response:
+            if deadline is not None and time.time() >= deadline:
+                print(f"\n评估超时 ({timeout}s)")
+                return RESULT_TIMEOUT
+            print("API调用失败")
+            return RESULT_API_ERROR
+
+        print(f"模型响应:\n{response}")
+        messages.append({"role": "assistant", "content": response})
+
+        # 解析动作
+        action_type, action_data = parse_action(response)
+        print(f"解析的动作: {action_type}, {action_data}")
+
+        # 记录交互历史
+        interaction_history.append({
+            "iteration": iteration,
+            "screenshot": f"screenshot_{iteration}.png",
+            "elements_info": text_info,
+            "model_response": response,
+            "action_type": action_type,
+            "action_data": str(action_data)
+        })
+
+        if action_type == 'answer':
+            print(f"\n{'='*50}")
+            print(f"测试结果: {action_data}")
+            print('='*50)
+
+            # 保存结果摘要
+            result = {
+                "url": url,
+                "task": task,
+                "expected": expected,
+                "result": action_data,
+                "iterations": iteration,
+                "model": backend.model,
+                "timestamp": datetime.now().isoformat()
+            }
+
+            with open(os.path.join(output_dir, "result.json"), "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+
+            # 保存完整交互历史
+            detailed_result = {
+                "summary": result,
+                "interaction_history": interaction_history
+            }
+
+            with open(os.path.join(output_dir, "detailed_result.json"), "w", encoding="utf-8") as f:
+                json.dump(detailed_result, f, indent=2, ensure_ascii=False)
+
+            return action_data
+
+        elif action_type:
+            # 移除标签再执行（避免点击到标签）；标注时拿到的句柄仍然有效，无需重新查找
+            remove_labels(driver)
+
+            success = execute_action(driver, action_type, action_data, elements, marked)
+            if success:
+                print(f"动作执行成功")
+            else:
+                print("动作执行失败")
+        else:
+            print("无法解析动作，请模型重试")
+
+    print("\n达到最大迭代次数，测试未完成")
+    return RESULT_MAX_ITER
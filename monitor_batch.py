@@ -1,11 +1,141 @@
 #!/usr/bin/env python3
-"""监控批量测试进度"""
+"""监控批量测试进度
+
+优先增量读取 batch_test_games.py 写出的 events.jsonl，显示吞吐量、预计剩余时间、
+进行中的任务数和各阶段延迟；没有事件日志时（旧版本的结果目录）退回到扫描结果目录。
+"""
 import os
 import json
 import time
+import argparse
 from pathlib import Path
 
+from progress_events import EventReader
+
 RESULTS_DIR = 'batch_test_results'
+EVENT_LOG = os.path.join(RESULTS_DIR, 'events.jsonl')
+RECENT_WINDOW = 300  # 近期吞吐量统计窗口（秒）
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+class ProgressState:
+    """由事件流累积出的批量测试状态"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, total_games=0, start_time=None):
+        self.total_games = total_games
+        self.start_time = start_time
+        self.finished = False
+        self.generating = set()
+        self.running_cases = set()
+        self.llm_in_flight = 0
+        self.num_cases = {}          # game -> 测试用例数
+        self.cases_done = {}         # game -> 已完成测试用例数
+        self.game_status = {}        # game -> 最终状态
+        self.results = {}            # YES/PARTIAL/NO/ERROR 计数
+        self.case_times = []         # 每个测试用例完成的时间戳
+        self.latencies = {'generate': [], 'case': [], 'llm': []}
+
+    def apply(self, event):
+        kind, game = event.get('event'), event.get('game')
+        if kind == 'batch_start':
+            self.reset(event.get('games', 0), event['ts'])
+        elif kind == 'generate_start':
+            self.generating.add(game)
+        elif kind == 'generate_done':
+            self.generating.discard(game)
+            self.num_cases[game] = event.get('num_cases', 0)
+            if event.get('latency'):
+                self.latencies['generate'].append(event['latency'])
+        elif kind == 'case_start':
+            self.running_cases.add((game, event.get('case')))
+        elif kind == 'case_done':
+            self.running_cases.discard((game, event.get('case')))
+            self.cases_done[game] = self.cases_done.get(game, 0) + 1
+            result = event.get('result', 'UNKNOWN')
+            self.results[result] = self.results.get(result, 0) + 1
+            self.case_times.append(event['ts'])
+            self.latencies['case'].append(event.get('latency', 0))
+        elif kind == 'llm_start':
+            self.llm_in_flight += 1
+        elif kind == 'llm_done':
+            self.llm_in_flight = max(self.llm_in_flight - 1, 0)
+            self.latencies['llm'].append(event.get('latency', 0))
+        elif kind == 'game_done':
+            self.game_status[game] = event.get('status')
+            self.generating.discard(game)
+            self.running_cases = {c for c in self.running_cases if c[0] != game}
+        elif kind == 'batch_done':
+            self.finished = True
+
+    def remaining_cases(self):
+        """尚未完成的测试用例数；还没生成用例的游戏按已生成游戏的平均用例数估计"""
+        remaining = sum(
+            max(n - self.cases_done.get(game, 0), 0)
+            for game, n in self.num_cases.items() if game not in self.game_status
+        )
+        known = [n for n in self.num_cases.values() if n]
+        pending_games = self.total_games - len(set(self.num_cases) | set(self.game_status))
+        if known and pending_games > 0:
+            remaining += pending_games * sum(known) / len(known)
+        return remaining
+
+
+def print_event_progress(state, now=None):
+    """打印基于事件日志的进度，返回是否全部完成"""
+    now = now or time.time()
+    print("\n" + "="*70)
+    print(f"批量测试进度监控 - {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    print("="*70)
+
+    done_games = len(state.game_status)
+    done_cases = len(state.case_times)
+    elapsed = now - state.start_time if state.start_time else 0
+    print(f"\n游戏: {done_games} / {state.total_games} 已完成  (运行 {elapsed/60:.1f} 分钟)")
+    print(f"测试用例: {done_cases} 已完成  "
+          + " ".join(f"{k}:{v}" for k, v in sorted(state.results.items())))
+
+    # 吞吐量
+    overall = done_cases / (elapsed / 60) if elapsed > 0 else 0.0
+    recent_cases = sum(1 for t in state.case_times if t >= now - RECENT_WINDOW)
+    recent_span = min(elapsed, RECENT_WINDOW)
+    recent = recent_cases / (recent_span / 60) if recent_span > 0 else 0.0
+    print(f"吞吐量: {overall:.2f} 用例/分钟 (总体), {recent:.2f} 用例/分钟 (最近{RECENT_WINDOW // 60}分钟)")
+
+    remaining = state.remaining_cases()
+    rate = recent or overall
+    if state.finished or done_games >= state.total_games > 0:
+        print("预计剩余: 0")
+    elif rate > 0:
+        print(f"预计剩余: 约 {remaining:.0f} 个用例, {remaining / rate:.1f} 分钟")
+    else:
+        print("预计剩余: 未知（尚无完成的用例）")
+
+    print(f"进行中: 生成用例 {len(state.generating)}, 执行用例 {len(state.running_cases)}, LLM请求 {state.llm_in_flight}")
+
+    print("\n阶段延迟 (秒):")
+    for stage, name in (('generate', '生成用例'), ('case', '执行用例'), ('llm', 'LLM请求')):
+        values = state.latencies[stage]
+        if values:
+            print(f"  {name}: n={len(values)} 平均={sum(values)/len(values):.1f} "
+                  f"p50={percentile(values, 0.5):.1f} p90={percentile(values, 0.9):.1f}")
+        else:
+            print(f"  {name}: -")
+
+    if state.finished or (state.total_games and done_games >= state.total_games):
+        print("\n🎉 所有测试已完成！")
+        return True
+    print(f"\n⏳ 还有 {state.total_games - done_games} 个游戏正在测试...")
+    return False
+
 
 def check_progress():
     """检查当前进度"""
@@ -89,6 +219,11 @@ def print_progress(games):
 if __name__ == '__main__':
     import sys
 
+    parser = argparse.ArgumentParser(description='监控批量测试进度')
+    parser.add_argument('--once', action='store_true', help='只打印一次')
+    parser.add_argument('--interval', type=float, default=30, help='刷新间隔（秒）')
+    args = parser.parse_args()
+
     # 检查是否有summary文件
     summary_file = Path(RESULTS_DIR) / 'batch_summary.json'
     if summary_file.exists():
@@ -115,11 +250,19 @@ if __name__ == '__main__':
         sys.exit(0)
 
     # 持续监控
+    reader = EventReader(EVENT_LOG)
+    state = ProgressState()
     while True:
-        games = check_progress()
-        all_done = print_progress(games)
+        if os.path.exists(EVENT_LOG):
+            # 只读取上次之后新增的事件
+            for event in reader.read_new():
+                state.apply(event)
+            all_done = print_event_progress(state)
+        else:
+            games = check_progress()
+            all_done = print_progress(games)
 
-        if all_done or '--once' in sys.argv:
+        if all_done or args.once:
             break
 
-        time.sleep(30)  # 每30秒检查一次
+        time.sleep(args.interval)
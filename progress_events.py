@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+批量测试进度事件日志
+
+工作进程/线程向 events.jsonl 追加一行一个的JSON事件，monitor_batch.py 只读取
+上次位置之后新增的内容，因此刷新开销与新事件数成正比，而不是与结果文件总数成正比。
+
+事件类型:
+    batch_start     {games}                  新的一轮批量测试（监控端据此重置状态）
+    generate_start  {game}
+    generate_done   {game, num_cases, latency}
+    case_start      {game, case}
+    case_done       {game, case, result, latency}
+    llm_start / llm_done {latency}           每次LLM请求
+    game_done       {game, status}
+    batch_done      {}
+"""
+
+import os
+import json
+import time
+import threading
+from types import SimpleNamespace
+
+
+class EventLog:
+    """线程安全的追加写事件日志；每个事件单独一次 write，多个进程同时追加也不会交错"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def emit(self, event, **fields):
+        record = {'ts': time.time(), 'event': event, 'pid': os.getpid()}
+        record.update(fields)
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        with self.lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+
+
+class NullEventLog:
+    """未指定事件日志时使用"""
+
+    def emit(self, event, **fields):
+        pass
+
+
+class _EventCompletions:
+
+    def __init__(self, completions, events):
+        self.completions = completions
+        self.events = events
+
+    def create(self, **kwargs):
+        self.events.emit('llm_start')
+        start = time.time()
+        try:
+            return self.completions.create(**kwargs)
+        finally:
+            self.events.emit('llm_done', latency=round(time.time() - start, 2))
+
+
+class EventClient:
+    """OpenAI客户端包装：每次 chat.completions.create 前后写 llm_start / llm_done 事件"""
+
+    def __init__(self, client, events):
+        self.chat = SimpleNamespace(completions=_EventCompletions(client.chat.completions, events))
+
+
+class EventReader:
+    """增量读取事件日志：每次 read_new() 只返回上次读取之后新增的完整事件"""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.partial = b''
+
+    def read_new(self):
+        if not os.path.exists(self.path):
+            return []
+        if os.path.getsize(self.path) < self.offset:
+            # 文件被截断或替换，从头读起
+            self.offset, self.partial = 0, b''
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+            self.offset = f.tell()
+
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()  # 最后一行可能尚未写完
+        events = []
+        for line in lines:
+            if line.strip():
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    pass
+        return events
@@ -0,0 +1,66 @@
+import random
+import time
+from argparse import ArgumentParser
+
+from decontamination_ngram import read_jsonl, decontaminate
+
+
+def make_synthetic_train(test_data, size, leak_rate=0.01, seed=0):
+    """
+    Synthetic train rows: mostly random word salads drawn from the test
+    vocabulary, plus a `leak_rate` fraction of lightly edited test instructions.
+    """
+    rng = random.Random(seed)
+    test_instructions = [item['instruction'] for item in test_data]
+    vocab = sorted({w for inst in test_instructions for w in inst.split()})
+    rows = []
+    for i in range(size):
+        if rng.random() < leak_rate:
+            words = rng.choice(test_instructions).split()
+            for _ in range(max(1, len(words) // 10)):
+                words[rng.randrange(len(words))] = rng.choice(vocab)
+        else:
+            words = rng.choices(vocab, k=rng.randint(20, 120))
+        rows.append({'id': i, 'instruction': ' '.join(words)})
+    return rows
+
+
+def contaminated_ids(train_data, test_data, threshold, method):
+    start = time.time()
+    _, contaminated = decontaminate(train_data, test_data, threshold, method=method)
+    return {item['id'] for item in contaminated}, time.time() - start
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--test_file", type=str, default="data/test.jsonl")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--exact_sample", type=int, default=1000,
+                        help="Rows checked with the all-pairs 'exact' method (too slow for the full set)")
+    args = parser.parse_args()
+
+    test_data = read_jsonl(args.test_file)
+    for size in args.sizes:
+        train_data = make_synthetic_train(test_data, size)
+        print(f"\n=== {size} train rows x {len(test_data)} test rows ===")
+
+        sample = train_data[:args.exact_sample]
+        exact_ids, exact_time = contaminated_ids(sample, test_data, args.threshold, 'exact')
+        sample_index_ids, _ = contaminated_ids(sample, test_data, args.threshold, 'index')
+        print(f"exact: {len(sample) / exact_time:,.0f} rows/s on {len(sample)} rows "
+              f"(~{size / (len(sample) / exact_time):,.0f}s extrapolated)")
+        print(f"index vs exact on sample: {'identical' if exact_ids == sample_index_ids else 'DIFFERENT'}")
+
+        index_ids, index_time = contaminated_ids(train_data, test_data, args.threshold, 'index')
+        print(f"index: {index_time:.1f}s ({size / index_time:,.0f} rows/s), {len(index_ids)} contaminated")
+
+        lsh_ids, lsh_time = contaminated_ids(train_data, test_data, args.threshold, 'lsh')
+        agree = len(lsh_ids & index_ids)
+        recall = agree / len(index_ids) if index_ids else 1.0
+        print(f"lsh:   {lsh_time:.1f}s ({size / lsh_time:,.0f} rows/s), {len(lsh_ids)} contaminated, "
+              f"agreement with exact: recall {recall:.4f}, missed {len(index_ids - lsh_ids)}")
+
+
+if __name__ == '__main__':
+    main()
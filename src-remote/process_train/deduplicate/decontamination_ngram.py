@@ -1,6 +1,11 @@
 import json
+import zlib
+from itertools import chain
+from collections import Counter, defaultdict
 from tqdm import tqdm
-from typing import Set
+from typing import Dict, List, Optional, Set
+
+import numpy as np
 
 
 def get_ngrams(text: str, n: int) -> Set[str]:
@@ -64,13 +69,143 @@ def is_contaminated(train_instruction, test_instruction, threshold=0.8):
     return len(intersection) / smaller_set_size > threshold
 
 
-def decontaminate(train_data, test_data, threshold):
+def build_test_index(test_instructions: List[str], n: int = 5) -> Dict:
+    """
+    Precompute word and n-gram sets of the test instructions once, plus
+    inverted indexes from each word / n-gram to the test items containing it.
+    """
+    test_words = [set(inst.split()) for inst in test_instructions]
+    test_ngrams = [get_ngrams(inst, n) for inst in test_instructions]
+    word_index = defaultdict(list)
+    ngram_index = defaultdict(list)
+    for idx, (words, ngrams) in enumerate(zip(test_words, test_ngrams)):
+        for word in words:
+            word_index[word].append(idx)
+        for ngram in ngrams:
+            ngram_index[ngram].append(idx)
+    return {
+        'n': n,
+        'test_words': test_words,
+        'test_ngrams': test_ngrams,
+        'word_index': word_index,
+        'ngram_index': ngram_index,
+    }
+
+
+def find_contaminating_test(train_instruction: str, index: Dict, threshold: float,
+                            candidates: Optional[Set[int]] = None) -> Optional[int]:
+    """
+    Indexed equivalent of `any(is_contaminated(train_instruction, t, threshold) for t in tests)`.
+
+    Shared word and n-gram counts are accumulated from the inverted indexes,
+    so only test items sharing at least one word are looked at. Returns the
+    index of a contaminating test item, or None.
+    """
+    train_words = set(train_instruction.split())
+    if not train_words:
+        return None
+    word_index = index['word_index']
+    word_hits = Counter(chain.from_iterable(word_index.get(word, ()) for word in train_words))
+    if candidates is not None:
+        word_hits = Counter({idx: cnt for idx, cnt in word_hits.items() if idx in candidates})
+    if not word_hits:
+        return None
+
+    train_ngrams = get_ngrams(train_instruction, index['n'])
+    ngram_index = index['ngram_index']
+    ngram_hits = Counter(chain.from_iterable(ngram_index.get(ngram, ()) for ngram in train_ngrams))
+
+    for idx, shared_words in word_hits.items():
+        shared_ngrams = ngram_hits[idx]
+        union = len(train_ngrams) + len(index['test_ngrams'][idx]) - shared_ngrams
+        if union and shared_ngrams / union > threshold:
+            return idx
+        if shared_words / min(len(train_words), len(index['test_words'][idx])) > threshold:
+            return idx
+    return None
+
+
+class MinHashLSH:
+    """
+    MinHash signatures over word sets with banded locality-sensitive hashing.
+
+    With `bands` bands of `rows` rows each, two sets with Jaccard similarity s
+    collide in at least one band with probability 1 - (1 - s^rows)^bands.
+    """
+
+    _PRIME = (1 << 31) - 1
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, seed: int = 42):
+        assert num_perm % bands == 0, "num_perm must be divisible by bands"
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, self._PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, self._PRIME, size=num_perm, dtype=np.uint64)
+        self.buckets = [defaultdict(list) for _ in range(bands)]
+
+    def signature(self, tokens: Set[str]) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(t.encode('utf-8')) for t in tokens), dtype=np.uint64, count=len(tokens))
+        hashes %= self._PRIME
+        return ((np.outer(hashes, self.a) + self.b) % self._PRIME).min(axis=0)
+
+    def _band_keys(self, sig: np.ndarray):
+        return [sig[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, key: int, tokens: Set[str]):
+        if tokens:
+            for bucket, band_key in zip(self.buckets, self._band_keys(self.signature(tokens))):
+                bucket[band_key].append(key)
+
+    def query(self, tokens: Set[str]) -> Set[int]:
+        if not tokens:
+            return set()
+        result = set()
+        for bucket, band_key in zip(self.buckets, self._band_keys(self.signature(tokens))):
+            result.update(bucket.get(band_key, ()))
+        return result
+
+
+def decontaminate(train_data, test_data, threshold, method='index', num_perm=128, bands=32):
+    """
+    Split train_data into (decontaminated, contaminated) against test_data.
+
+    method:
+        'exact': compare every train/test pair with is_contaminated.
+        'index': same result as 'exact', using precomputed test sets and
+                 inverted word / n-gram indexes.
+        'lsh':   MinHash-LSH over word sets picks candidate test items, which
+                 then get the exact check. Approximate: pairs whose word
+                 Jaccard is low but overlap with the smaller set is high
+                 (e.g. a short train instruction inside a long test one) can
+                 be missed.
+    """
     test_instructions = [item['instruction'] for item in test_data]
 
+    index = lsh = None
+    if method in ('index', 'lsh'):
+        index = build_test_index(test_instructions)
+    if method == 'lsh':
+        lsh = MinHashLSH(num_perm=num_perm, bands=bands)
+        for idx, words in enumerate(index['test_words']):
+            lsh.add(idx, words)
+
     decontaminated_train = []
     contaminated_train = []
     for train_item in tqdm(train_data):
-        if not any(is_contaminated(train_item['instruction'], test_inst, threshold) for test_inst in test_instructions):
+        instruction = train_item['instruction']
+        if method == 'exact':
+            contaminated = any(is_contaminated(instruction, test_inst, threshold) for test_inst in test_instructions)
+        elif method == 'index':
+            contaminated = find_contaminating_test(instruction, index, threshold) is not None
+        elif method == 'lsh':
+            candidates = lsh.query(set(instruction.split()))
+            contaminated = bool(candidates) and \
+                find_contaminating_test(instruction, index, threshold, candidates) is not None
+        else:
+            raise ValueError(f"Unknown method: {method}")
+
+        if not contaminated:
             decontaminated_train.append(train_item)
         else:
             contaminated_train.append(train_item)
@@ -1,10 +1,9 @@
 import json
 import argparse
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from tqdm import tqdm
 import numpy as np
 
+from embedding_index import EmbeddingStore, blocked_similarity_search, l2_normalize
+
 
 def load_questions(jsonl_path, key="instruction"):
     data = []
@@ -21,30 +20,44 @@ def extract_questions(data, key="instruction"):
 
 
 def compute_similarity_matrix(test_qs, train_qs, model_name='all-MiniLM-L6-v2'):
+    from sentence_transformers import SentenceTransformer
+
     model = SentenceTransformer(model_name)
     test_embeddings = model.encode(test_qs, convert_to_tensor=True, show_progress_bar=True)
     train_embeddings = model.encode(train_qs, convert_to_tensor=True, show_progress_bar=True)
-    sim_matrix = cosine_similarity(test_embeddings.cpu().numpy(), train_embeddings.cpu().numpy())
+    sim_matrix = l2_normalize(test_embeddings.cpu().numpy()) @ l2_normalize(train_embeddings.cpu().numpy()).T
     return sim_matrix
 
 
+def compute_train_max_similarity(test_qs, train_qs, embedding_dir, model_name='all-MiniLM-L6-v2', block_size=65536):
+    """
+    Highest cosine similarity of each training question to any test question,
+    without building the dense test x train matrix. Embeddings come from the shared
+    EmbeddingStore in `embedding_dir`, so only new instructions are encoded.
+    """
+    store = EmbeddingStore(embedding_dir, model_name)
+    test_emb = np.asarray(store.lookup(test_qs)[:])
+    train_emb = store.lookup(train_qs)
+    _, _, train_max = blocked_similarity_search(test_emb, train_emb, top_k=1, block_size=block_size)
+    return train_max
+
+
+def filter_training_data_by_max(train_data, train_max, threshold=0.9):
+    """
+    Same as filter_training_data, given each training sample's max similarity to the test set.
+    """
+    remove_mask = train_max >= threshold
+    to_remove = set(np.nonzero(remove_mask)[0].tolist())
+    filtered_data = [ex for ex, remove in zip(train_data, remove_mask) if not remove]
+    removed_data = [ex for ex, remove in zip(train_data, remove_mask) if remove]
+    return filtered_data, to_remove, removed_data
+
+
 def filter_training_data(train_data, sim_matrix, threshold=0.9):
     """
     Remove training samples if they are similar to any test sample above the threshold.
     """
-    to_remove = set()
-    num_test = sim_matrix.shape[0]
-    num_train = sim_matrix.shape[1]
-
-    for train_idx in range(num_train):
-        for test_idx in range(num_test):
-            if sim_matrix[test_idx, train_idx] >= threshold:
-                to_remove.add(train_idx)
-                break
-
-    filtered_data = [ex for idx, ex in enumerate(train_data) if idx not in to_remove]
-    removed_data = [ex for idx, ex in enumerate(train_data) if idx in to_remove]
-    return filtered_data, to_remove, removed_data
+    return filter_training_data_by_max(train_data, sim_matrix.max(axis=0), threshold)
 
 
 def main():
@@ -54,6 +67,8 @@ def main():
     parser.add_argument("--output_file", type=str, default="filtered_train.jsonl", help="Output filtered train file")
     parser.add_argument("--contaminated_file", type=str, default="contaminated_train.jsonl", help="Output filtered train file")
     parser.add_argument("--sim_threshold", type=float, default=0.9, help="Similarity threshold")
+    parser.add_argument("--embedding_dir", type=str, default="data/embedding_store", help="Embedding cache shared by the decontamination scripts")
+    parser.add_argument("--block_size", type=int, default=65536, help="Train rows per similarity block")
 
     args = parser.parse_args()
 
@@ -65,10 +80,10 @@ def main():
     train_qs = extract_questions(train_data, key="instruction")
 
     print("🔹 Computing semantic similarity...")
-    sim_matrix = compute_similarity_matrix(test_qs, train_qs)
+    train_max = compute_train_max_similarity(test_qs, train_qs, args.embedding_dir, block_size=args.block_size)
 
     print("🔹 Filtering training samples...")
-    filtered_train_data, removed_indices, removed_data = filter_training_data(train_data, sim_matrix, threshold=args.sim_threshold)
+    filtered_train_data, removed_indices, removed_data = filter_training_data_by_max(train_data, train_max, threshold=args.sim_threshold)
 
     print(f"✅ Removed {len(removed_indices)} out of {len(train_data)} training samples.")
 
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import numpy as np
+from tqdm import tqdm
+
+
+def l2_normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+class EmbeddingView:
+    """
+    Rows of an embedding matrix selected by index; slicing reads only the
+    requested rows from the memory map.
+    """
+
+    def __init__(self, matrix, rows):
+        self.matrix = matrix
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.shape = (len(self.rows), matrix.shape[1])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, item):
+        return self.matrix[self.rows[item]]
+
+
+class EmbeddingStore:
+    """
+    Content-hash keyed embedding cache shared by the decontamination scripts.
+
+    Layout in `store_dir/<model name>/`:
+        embeddings.f32  append-only float32 matrix of L2-normalized embeddings
+        index.jsonl     one {"hash", "row"} line per embedded text
+        meta.json       model name and embedding dimension
+
+    Only texts whose SHA-1 is not in the index get encoded, and new rows are
+    appended, so re-runs and new train shards only pay for new instructions.
+    Rows are written before their index lines, so an interrupted run never
+    leaves the index pointing at missing rows; rows (or partial rows) beyond
+    the index, and a partial last index line, are cut off before the next
+    append. Assumes one writer at a time.
+    """
+
+    def __init__(self, store_dir, model_name='all-MiniLM-L6-v2', batch_size=1024):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.dir = os.path.join(store_dir, model_name.replace('/', '_'))
+        os.makedirs(self.dir, exist_ok=True)
+        self.matrix_path = os.path.join(self.dir, 'embeddings.f32')
+        self.index_path = os.path.join(self.dir, 'index.jsonl')
+        self.meta_path = os.path.join(self.dir, 'meta.json')
+        self._model = None
+        self.dim = None
+        self.index = {}
+        if os.path.isfile(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+        if os.path.isfile(self.index_path):
+            valid_bytes = 0
+            with open(self.index_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # interrupted while writing this line
+                    entry = json.loads(line)
+                    self.index[entry['hash']] = entry['row']
+                    valid_bytes += len(line)
+            if valid_bytes < os.path.getsize(self.index_path):
+                os.truncate(self.index_path, valid_bytes)
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _matrix(self):
+        if not self.index:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        n_rows = len(self.index)
+        return np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(n_rows, self.dim))
+
+    def add(self, texts):
+        """Embed and append the texts that are not in the store yet."""
+        missing = {}
+        for text in texts:
+            h = self.text_hash(text)
+            if h not in self.index and h not in missing:
+                missing[h] = text
+        if not missing:
+            return 0
+        if self.dim is None:
+            self.dim = self.model.get_sentence_embedding_dimension()
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'model_name': self.model_name, 'dim': self.dim}, f)
+
+        hashes = list(missing)
+        # The index is the source of truth: drop rows an interrupted run wrote without indexing them
+        next_row = len(self.index)
+        if os.path.isfile(self.matrix_path) and os.path.getsize(self.matrix_path) != next_row * 4 * self.dim:
+            os.truncate(self.matrix_path, next_row * 4 * self.dim)
+        for start in tqdm(range(0, len(hashes), self.batch_size), desc=f"Embedding {len(hashes)} new texts"):
+            batch = hashes[start:start + self.batch_size]
+            emb = self.model.encode([missing[h] for h in batch], convert_to_numpy=True, show_progress_bar=False)
+            with open(self.matrix_path, 'ab') as f:
+                f.write(l2_normalize(emb).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                for h in batch:
+                    f.write(json.dumps({'hash': h, 'row': next_row}) + '\n')
+                    self.index[h] = next_row
+                    next_row += 1
+        return len(hashes)
+
+    def lookup(self, texts):
+        """Embeddings for `texts` (in order) as a memory-mapped view, embedding new ones first."""
+        self.add(texts)
+        rows = [self.index[self.text_hash(text)] for text in texts]
+        return EmbeddingView(self._matrix(), rows)
+
+
+def blocked_similarity_search(test_emb, train_emb, top_k=5, block_size=65536):
+    """
+    Cosine similarity between normalized test and train embeddings, computed
+    one train block at a time so memory is O(test x block_size) no matter how
+    large the train set is.
+
+    Returns:
+        topk_scores:  (num_test, top_k) best train similarities per test row, descending.
+        topk_indices: (num_test, top_k) matching train indices.
+        train_max:    (num_train,) highest similarity of each train row to any test row.
+    """
+    test_emb = np.ascontiguousarray(test_emb, dtype=np.float32)
+    num_test, num_train = test_emb.shape[0], train_emb.shape[0]
+    top_k = min(top_k, num_train)
+    topk_scores = np.full((num_test, top_k), -np.inf, dtype=np.float32)
+    topk_indices = np.zeros((num_test, top_k), dtype=np.int64)
+    train_max = np.empty(num_train, dtype=np.float32)
+    if top_k == 0:
+        return topk_scores, topk_indices, train_max
+
+    for start in tqdm(range(0, num_train, block_size), desc="Similarity blocks"):
+        block = np.asarray(train_emb[start:start + block_size], dtype=np.float32)
+        sims = test_emb @ block.T
+        train_max[start:start + len(block)] = sims.max(axis=0)
+
+        k = min(top_k, sims.shape[1])
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        cand_scores = np.concatenate([topk_scores, np.take_along_axis(sims, part, axis=1)], axis=1)
+        cand_indices = np.concatenate([topk_indices, part + start], axis=1)
+        keep = np.argpartition(-cand_scores, top_k - 1, axis=1)[:, :top_k]
+        topk_scores = np.take_along_axis(cand_scores, keep, axis=1)
+        topk_indices = np.take_along_axis(cand_indices, keep, axis=1)
+
+    order = np.argsort(-topk_scores, axis=1)
+    return (
+        np.take_along_axis(topk_scores, order, axis=1),
+        np.take_along_axis(topk_indices, order, axis=1),
+        train_max,
+    )
+
+
+if __name__ == '__main__':
+    # Append new train shards to the store ahead of a decontamination run.
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--embedding_dir", type=str, default="data/embedding_store")
+    parser.add_argument("--model_name", type=str, default="all-MiniLM-L6-v2")
+    parser.add_argument("--files", type=str, nargs="+", required=True, help="JSONL shards with an 'instruction' field")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.embedding_dir, args.model_name)
+    for path in args.files:
+        with open(path, 'r', encoding='utf-8') as f:
+            texts = [obj["instruction"] for obj in map(json.loads, f) if "instruction" in obj]
+        print(f"{path}: {store.add(texts)} new of {len(texts)} instructions embedded")
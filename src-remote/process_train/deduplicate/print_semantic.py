@@ -1,9 +1,9 @@
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import json
 import argparse
 
+from embedding_index import EmbeddingStore, blocked_similarity_search, l2_normalize
+
 def load_questions(jsonl_path, key="Q"):
     """
     Load questions from a JSONL file. Each line is a dict with a 'Q' field.
@@ -20,14 +20,43 @@ def compute_similarity_matrix(test_qs, train_qs, model_name='all-MiniLM-L6-v2'):
     """
     Compute cosine similarity between test and training questions.
     """
+    from sentence_transformers import SentenceTransformer
+
     model = SentenceTransformer(model_name)
 
     test_embeddings = model.encode(test_qs, convert_to_tensor=True, show_progress_bar=True)
     train_embeddings = model.encode(train_qs, convert_to_tensor=True, show_progress_bar=True)
 
-    similarity_matrix = cosine_similarity(test_embeddings.cpu().numpy(), train_embeddings.cpu().numpy())
+    similarity_matrix = l2_normalize(test_embeddings.cpu().numpy()) @ l2_normalize(train_embeddings.cpu().numpy()).T
     return similarity_matrix
 
+def compute_top_matches(test_qs, train_qs, embedding_dir, top_k=5, model_name='all-MiniLM-L6-v2', block_size=65536):
+    """
+    Top-K training questions per test question via blocked search over the
+    shared EmbeddingStore in `embedding_dir`, without the dense similarity matrix.
+    """
+    store = EmbeddingStore(embedding_dir, model_name)
+    test_emb = np.asarray(store.lookup(test_qs)[:])
+    train_emb = store.lookup(train_qs)
+    topk_scores, topk_indices, _ = blocked_similarity_search(test_emb, train_emb, top_k=top_k, block_size=block_size)
+    return topk_scores, topk_indices
+
+
+def print_topk_matches(test_qs, train_qs, topk_scores, topk_indices, sim_threshold=0.9):
+    """
+    Same output as print_top_matches, from precomputed top-K scores and indices.
+    """
+    top_matches = []
+    for i, test_q in enumerate(test_qs):
+        print(f"\nTest Q[{i}]: {test_q}")
+        entry = {"test_instruction": test_q, "matches": []}
+        for j, score in zip(topk_indices[i], topk_scores[i]):
+            if score >= sim_threshold:
+                print(f"  ↪ Similarity: {score:.4f} | Train Q[{j}]: {train_qs[j]}")
+                entry["matches"].append({"train_instruction": train_qs[j], "similarity": float(score)})
+        top_matches.append(entry)
+    return top_matches
+
 def print_top_matches(test_qs, train_qs, sim_matrix, top_k=5, sim_threshold=0.9):
     """
     Print top-K most similar training questions for each test question.
@@ -51,13 +80,15 @@ def main():
     parser.add_argument("--train_file", type=str, required=True, help="Path to JSONL file with train QA pairs (key='Q')")
     parser.add_argument("--top_k", type=int, default=5, help="Top-K matches to print")
     parser.add_argument("--sim_threshold", type=float, default=0.9, help="Min similarity to print")
+    parser.add_argument("--embedding_dir", type=str, default="data/embedding_store", help="Embedding cache shared by the decontamination scripts")
+    parser.add_argument("--block_size", type=int, default=65536, help="Train rows per similarity block")
     args = parser.parse_args()
 
     test_qs = load_questions(args.test_file, key="instruction")
     train_qs = load_questions(args.train_file, key="instruction")
 
-    sim_matrix = compute_similarity_matrix(test_qs, train_qs)
-    top_matches = print_top_matches(test_qs, train_qs, sim_matrix, top_k=args.top_k, sim_threshold=args.sim_threshold)
+    topk_scores, topk_indices = compute_top_matches(test_qs, train_qs, args.embedding_dir, top_k=args.top_k, block_size=args.block_size)
+    top_matches = print_topk_matches(test_qs, train_qs, topk_scores, topk_indices, sim_threshold=args.sim_threshold)
     with open("src-remote/process_train/deduplicate/top_matches.json", "w", encoding="utf-8") as f:
         json.dump(top_matches, f, ensure_ascii=False, indent=4)
 
@@ -1,7 +1,9 @@
 import json
-from multiprocessing import Pool, cpu_count
+import zlib
+from multiprocessing import Pipe, Process, cpu_count
 from tqdm import tqdm
 import editdistance
+import numpy as np
 import os
 
 def load_jsonl(file_path):
@@ -13,32 +15,134 @@ def save_jsonl(data, file_path):
         for item in data:
             f.write(json.dumps(item, ensure_ascii=False) + '\n')
 
-def is_duplicate(args):
-    item, unique_items, threshold = args
-    for u_item in unique_items:
-        if abs(len(item['instruction']) - len(u_item['instruction'])) > threshold:
-            continue
-        if item['instruction'] == u_item['instruction'] or editdistance.eval(item['instruction'], u_item['instruction']) <= threshold:
+class InstructionIndex:
+    """
+    Unique instructions plus a hashed q-gram profile of each, so a lookup
+    only runs editdistance on a handful of candidates.
+
+    Candidates must have a length within `threshold` of the query and pass the
+    q-gram lemma: strings within edit distance k share at least
+    max(|a|, |b|) - q + 1 - k * q q-grams. Q-grams are hashed into `bins`
+    buckets; bucket collisions can only raise the shared count, so the filter
+    never drops a true duplicate. The check is one vectorized pass over all
+    stored profiles.
+    """
+
+    def __init__(self, threshold, q=3, bins=1024):
+        self.threshold = threshold
+        self.q = q
+        self.bins = bins
+        self.text_set = set()
+        self.texts = []
+        self.lengths = np.zeros(1024, dtype=np.int64)
+        self.profiles = np.zeros((1024, bins), dtype=np.uint16)
+
+    def _profile(self, text):
+        hashes = [zlib.crc32(text[i:i + self.q].encode('utf-8')) % self.bins for i in range(len(text) - self.q + 1)]
+        return np.bincount(hashes, minlength=self.bins).astype(np.uint16)
+
+    def add(self, text):
+        n = len(self.texts)
+        if n == len(self.lengths):
+            self.lengths = np.resize(self.lengths, 2 * n)
+            self.profiles = np.concatenate([self.profiles, np.zeros_like(self.profiles)])
+        self.text_set.add(text)
+        self.texts.append(text)
+        self.lengths[n] = len(text)
+        self.profiles[n] = self._profile(text)
+
+    def matches(self, text):
+        if text in self.text_set:
             return True
-    return False
+        n = len(self.texts)
+        if n == 0:
+            return False
+        lengths = self.lengths[:n]
+        candidates = np.nonzero(np.abs(lengths - len(text)) <= self.threshold)[0]
+        if len(candidates) == 0:
+            return False
+        min_shared = np.maximum(lengths[candidates], len(text)) - self.q + 1 - self.threshold * self.q
+        if (min_shared > 0).any():
+            shared = np.minimum(self.profiles[candidates], self._profile(text)).sum(axis=1)
+            candidates = candidates[shared >= min_shared]
+        for idx in candidates:
+            if editdistance.eval(text, self.texts[idx]) <= self.threshold:
+                return True
+        return False
+
 
-def deduplicate_instructions(input_paths, output_path, threshold=5):
+def _shard_worker(conn, threshold, q):
+    # Owns one shard of the unique set. Each message carries the instructions
+    # newly assigned to this shard and the next block to check against it.
+    index = InstructionIndex(threshold, q)
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        new_texts, block = msg
+        for text in new_texts:
+            index.add(text)
+        conn.send([index.matches(text) for text in block])
+    conn.close()
+
+
+def deduplicate_instructions(input_paths, output_path, threshold=5, num_workers=None, block_size=1024, q=3):
+    """
+    Keep the first occurrence of every group of instructions within
+    `threshold` edit distance of an earlier kept one (sequential first-wins).
+
+    The kept set is split round-robin across `num_workers` shard processes.
+    Each block of `block_size` items is checked against all shards in
+    parallel; items in the same block are then resolved in order against
+    each other, which keeps the result identical to the sequential scan.
+    """
     data = []
     for input_path in input_paths:
         data.extend(load_jsonl(input_path))
     unique_data = []
+    num_workers = num_workers or cpu_count()
 
-    with Pool(cpu_count()) as pool:
+    if num_workers <= 1:
+        index = InstructionIndex(threshold, q)
         for item in tqdm(data, desc='Deduplicating instructions'):
-            if not unique_data:
+            if not index.matches(item['instruction']):
+                index.add(item['instruction'])
                 unique_data.append(item)
-                continue
+        save_jsonl(unique_data, output_path)
+        return
 
-            args = [(item, unique_data, threshold)]
-            result = pool.map(is_duplicate, args)[0]
+    conns, workers = [], []
+    for _ in range(num_workers):
+        parent_conn, child_conn = Pipe()
+        worker = Process(target=_shard_worker, args=(child_conn, threshold, q), daemon=True)
+        worker.start()
+        conns.append(parent_conn)
+        workers.append(worker)
+    pending = [[] for _ in range(num_workers)]
 
-            if not result:
-                unique_data.append(item)
+    try:
+        with tqdm(total=len(data), desc='Deduplicating instructions') as pbar:
+            for start in range(0, len(data), block_size):
+                block_items = data[start:start + block_size]
+                block = [item['instruction'] for item in block_items]
+                for shard, conn in enumerate(conns):
+                    conn.send((pending[shard], block))
+                    pending[shard] = []
+                shard_results = [conn.recv() for conn in conns]
+
+                block_index = InstructionIndex(threshold, q)
+                for i, (item, text) in enumerate(zip(block_items, block)):
+                    if any(result[i] for result in shard_results) or block_index.matches(text):
+                        continue
+                    block_index.add(text)
+                    pending[len(unique_data) % num_workers].append(text)
+                    unique_data.append(item)
+                pbar.update(len(block))
+    finally:
+        for conn in conns:
+            conn.send(None)
+        for worker in workers:
+            worker.join()
 
     save_jsonl(unique_data, output_path)
 
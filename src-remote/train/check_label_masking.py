@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Parity check: labels from the vectorized DialogueProcessor.mask_labels must
+match the reference token loop (mask_labels_loop) on real training samples.
+
+    python src-remote/train/check_label_masking.py \
+        --model_cfg models/Qwen2.5-Coder-7B-Instruct \
+        --train_file data/train_data/messages_select_600.jsonl
+"""
+
+import json
+import time
+import argparse
+
+from transformers import AutoTokenizer
+
+from utils.loader import DialogueProcessor, mask_labels_loop
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_cfg", type=str, required=True)
+    parser.add_argument("--train_file", type=str, required=True)
+    parser.add_argument("--num_samples", type=int, default=200)
+    args = parser.parse_args()
+
+    processor = DialogueProcessor(model_path=args.model_cfg)
+    tokenizer = AutoTokenizer.from_pretrained(args.model_cfg, trust_remote_code=True)
+    tokenizer.add_special_tokens(dict(additional_special_tokens=processor.get_special_token()))
+
+    texts = []
+    with open(args.train_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            texts.append(processor.process_input(json.loads(line))['text'])
+            if len(texts) >= args.num_samples:
+                break
+
+    all_tokens = tokenizer(texts, truncation=False, padding=False)['input_ids']
+
+    loop_time = vec_time = 0.0
+    mismatches = 0
+    for tokens in all_tokens:
+        start = time.time()
+        expected = mask_labels_loop(tokens, tokenizer.convert_ids_to_tokens(tokens))
+        loop_time += time.time() - start
+
+        start = time.time()
+        labels = processor.mask_labels(tokens, tokenizer)
+        vec_time += time.time() - start
+
+        if labels != expected:
+            mismatches += 1
+
+    print(f"{len(all_tokens)} samples, {sum(map(len, all_tokens))} tokens, {mismatches} mismatches")
+    print(f"loop: {loop_time:.3f}s  vectorized: {vec_time:.3f}s")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,14 +11,18 @@ import numpy as np
 import torch.distributed as dist
 
 from datetime import datetime
+from packaging import version
 from dataclasses import field, dataclass
 from utils.util import set_logger, print_args
 
-from utils.loader import PROCESSOR
+from utils.loader import PROCESSOR, padding_ratio
 from utils.trainer import LoggerCallback, RemoveStateCallback
+from utils.data_cache import preprocess_fingerprint, load_cached_dataset, save_cached_dataset, list_data_files
+from utils.streaming import StreamingDialogueDataset
+from utils.mixture import MixtureDataset, generate_grouped_rows
 
 from transformers.tokenization_utils import AddedToken
-from datasets import load_dataset, concatenate_datasets
+from datasets import Dataset, load_dataset, concatenate_datasets
 from transformers import (
     Trainer,
     set_seed,
@@ -33,6 +37,10 @@ from transformers import (
 
 logger = logging.getLogger()
 
+# first transformers release whose flash-attention path splits packed rows on position_ids
+# (needed by --packing best_fit and --streaming_data)
+BEST_FIT_MIN_TRANSFORMERS = '4.44.0'
+
 @dataclass
 class DataArguments:
 
@@ -43,11 +51,16 @@ class DataArguments:
     train_file: str = field(default=None)
     train_coef: str = field(default=None)
     delete_long_sample: bool = field(default=False)
+    packing: str = field(default='greedy', metadata={"choices": ["greedy", "best_fit"]})
 
     # process
     max_len: int = field(default=2048)
     processor: str = field(default='code_dialogue')
     preprocessing_num_workers: int = field(default=64)
+    preprocess_cache_dir: str = field(default=None)
+    streaming_data: bool = field(default=False, metadata={"help": f"Stream and pack the training files on the fly; packed rows restart position_ids per sample, so this needs transformers>={BEST_FIT_MIN_TRANSFORMERS}."})
+    stream_token_budget: int = field(default=None, metadata={"help": "Tokens per packed row with --streaming_data (default: max_len). Every batch is per_device_train_batch_size rows of exactly this many tokens; samples longer than it are dropped."})
+    stream_buffer_size: int = field(default=1024, metadata={"help": "Samples buffered per DataLoader worker before best-fit packing them into rows."})
     
     # model
     model_cfg: str = field(default="data/models/starcoder")
@@ -57,6 +70,9 @@ class DataArguments:
 
     # output
     stream: bool = field(default=False)
+    keep_state_last: int = field(default=1, metadata={"help": "Number of newest checkpoints that keep optimizer / DeepSpeed state."})
+    keep_best_state: bool = field(default=False, metadata={"help": "Also keep the state of state.best_model_checkpoint."})
+    prune_queue_size: int = field(default=4)
 
 
 def resize(model, tokenizer, special_tokens):
@@ -83,68 +99,7 @@ def resize(model, tokenizer, special_tokens):
         input_embeddings[-num_new_tokens:] = input_embeddings_avg
         output_embeddings[-num_new_tokens:] = output_embeddings_avg
 
-def train():
-    parser = HfArgumentParser((DataArguments, TrainingArguments))
-
-    data_args, training_args = parser.parse_args_into_dataclasses()
-
-    training_args._frozen = False
-
-    if not data_args.no_timestamps:
-        timestr = datetime.now().strftime("-%m%d%H%M")
-        training_args.output_dir = training_args.output_dir + timestr
-
-    training_args.logging_dir = os.path.join(training_args.output_dir, 'logging')
-
-    if os.path.exists(training_args.output_dir):
-        if training_args.overwrite_output_dir:
-            if training_args.process_index == 0:
-                shutil.rmtree(training_args.output_dir)
-        else:
-            raise ValueError(f"Output directory ({training_args.output_dir}) already exists. Use --overwrite_output_dir to overcome.")
-    
-    if training_args.world_size > 1:
-        dist.barrier()
-    
-    if training_args.process_index == 0:
-        os.makedirs(training_args.output_dir)
-    
-    if training_args.world_size > 1:
-        dist.barrier()
-    
-    set_seed(training_args.seed)
-
-    node_rank = int(os.getenv('GROUP_RANK', '0'))
-
-    for _logger in [logger, transformers.utils.logging.get_logger(), logging.getLogger('DeepSpeed')]:
-        set_logger(_logger, training_args.local_rank, data_args.stream, os.path.join(training_args.output_dir, f'log-node-{node_rank}.log'))
-
-    logger.warning("Device: %s, rank: %s, world size: %s", training_args.device, training_args.process_index, training_args.world_size)
-
-    if training_args.world_size > 1:
-        dist.barrier()
-
-    print_args(data_args, 'Data Arguments')
-    print_args(training_args, 'Training Arguments')
-
-    processor = PROCESSOR[data_args.processor](model_path=data_args.model_cfg)
-
-    config = AutoConfig.from_pretrained(data_args.model_cfg, trust_remote_code=True)
-    config.use_cache = False
-
-    if data_args.no_load_model_pararmeters:
-        model = AutoModelForCausalLM.from_config(config, trust_remote_code=True, attn_implementation = "flash_attention_2")
-    else:
-        model = AutoModelForCausalLM.from_pretrained(data_args.model_cfg, config=config, torch_dtype=torch.bfloat16, trust_remote_code=True, attn_implementation = "flash_attention_2")
-    # tokenizer = AutoTokenizer.from_pretrained(data_args.model_cfg, legacy=False, use_fast=True)
-    tokenizer = AutoTokenizer.from_pretrained(data_args.model_cfg, trust_remote_code=True)
-
-    if tokenizer.pad_token is None:
-        tokenizer.pad_token = tokenizer.eos_token
-        tokenizer.pad_token_id = tokenizer.eos_token_id
-
-    resize(model, tokenizer, processor.get_special_token())
-    
+def build_train_dataset(data_args, training_args, processor, tokenizer):
     train_sets = []
     for src in data_args.train_file.split(','):
         if os.path.isdir(src):
@@ -155,6 +110,7 @@ def train():
     lengths = np.array([_set.shape[0] for _set in train_sets])
     logger.info("Data Lengths: %s", lengths)
 
+    sample_nums = None
     if data_args.train_coef is not None:
         
         coefs = np.array([float(_coef) for _coef in data_args.train_coef.split(',')])
@@ -163,16 +119,7 @@ def train():
         sample_nums = np.max(lengths / coefs) * coefs
 
         logger.info("Sampled Lengths: %s", sample_nums)
-
-        rand = random.Random(training_args.seed)
-        for i, _sample_num in enumerate(sample_nums):
-            indices = list(range(lengths[i]))
-
-            main_indices = indices * int(_sample_num // lengths[i])
-            if _sample_num % lengths[i] > 0:
-                main_indices += rand.sample(indices, int(_sample_num % lengths[i]))
-            
-            train_sets[i] = train_sets[i].select(main_indices)
+        # Sources are tokenized once and upsampled lazily by MixtureDataset below.
 
     for i in range(1, len(train_sets)):
         train_sets[i] = train_sets[i].cast(train_sets[0].features)
@@ -231,22 +178,67 @@ def train():
                 label_tokens
             )
     
-    train_sets = train_sets.shuffle(seed=training_args.seed)
-    column_names = list(train_sets.features)
-    with training_args.main_process_first(desc="dataset map grouping"):
-        train_sets = train_sets.map(
-            processor.group_texts,
-            fn_kwargs={
-                "tokenizer": tokenizer, 
-                "max_len": data_args.max_len
-            },
-            batched=True,
-            load_from_cache_file=False,
-            remove_columns=column_names,
-            batch_size=process_batch_size,
-            num_proc=data_args.preprocessing_num_workers,
-            desc=f"Grouping texts in chunks of {data_args.max_len}",
-        )
+    sample_lengths = train_sets.map(
+        lambda input_ids: {"length": [len(_input_ids) for _input_ids in input_ids]},
+        input_columns="input_ids",
+        batched=True,
+        remove_columns=list(train_sets.features),
+        num_proc=data_args.preprocessing_num_workers,
+        desc="Measuring sample lengths",
+    )["length"]
+    # Estimate on a shuffled order, as the grouping batches see it.
+    random.Random(training_args.seed).shuffle(sample_lengths)
+    logger.info(
+        "Estimated padding ratio: greedy %.4f, best_fit %.4f (using %s)",
+        padding_ratio(sample_lengths, data_args.max_len, process_batch_size, 'greedy'),
+        padding_ratio(sample_lengths, data_args.max_len, process_batch_size, 'best_fit'),
+        data_args.packing
+    )
+
+    if data_args.packing == 'best_fit':
+        too_long = [length for length in sample_lengths if length > data_args.max_len]
+        if too_long:
+            logger.warning(
+                "best_fit packing drops %d samples (%d tokens) longer than max_len %d, %d cases remain",
+                len(too_long), sum(too_long), data_args.max_len, len(sample_lengths) - len(too_long)
+            )
+
+    group_fn = processor.pack_texts if data_args.packing == 'best_fit' else processor.group_texts
+    if sample_nums is None:
+        train_sets = train_sets.shuffle(seed=training_args.seed)
+        column_names = list(train_sets.features)
+        with training_args.main_process_first(desc="dataset map grouping"):
+            train_sets = train_sets.map(
+                group_fn,
+                fn_kwargs={
+                    "tokenizer": tokenizer, 
+                    "max_len": data_args.max_len
+                },
+                batched=True,
+                load_from_cache_file=False,
+                remove_columns=column_names,
+                batch_size=process_batch_size,
+                num_proc=data_args.preprocessing_num_workers,
+                desc=f"Grouping texts in chunks of {data_args.max_len}",
+            )
+    else:
+        mixture = MixtureDataset(train_sets, lengths, sample_nums, training_args.seed)
+        blocks = [
+            (start, min(start + process_batch_size, len(mixture)))
+            for start in range(0, len(mixture), process_batch_size)
+        ]
+        with training_args.main_process_first(desc="dataset mixture grouping"):
+            train_sets = Dataset.from_generator(
+                generate_grouped_rows,
+                gen_kwargs={
+                    "blocks": blocks,
+                    "mixture": mixture,
+                    "group_fn": group_fn,
+                    "tokenizer": tokenizer,
+                    "max_len": data_args.max_len
+                },
+                num_proc=min(data_args.preprocessing_num_workers, len(blocks)),
+            )
     
     with training_args.main_process_first(desc="Log a few random samples from the grouped training set"):
         for index in random.sample(range(len(train_sets)), 3):
@@ -255,12 +247,114 @@ def train():
                 index, tokenizer.decode(train_sets[index]['input_ids'])
             )
 
+    return train_sets
+
+def train():
+    parser = HfArgumentParser((DataArguments, TrainingArguments))
+
+    data_args, training_args = parser.parse_args_into_dataclasses()
+
+    if (data_args.packing == 'best_fit' or data_args.streaming_data) and version.parse(transformers.__version__) < version.parse(BEST_FIT_MIN_TRANSFORMERS):
+        flag = '--packing best_fit' if data_args.packing == 'best_fit' else '--streaming_data'
+        raise ValueError(f"{flag} requires transformers>={BEST_FIT_MIN_TRANSFORMERS}, found {transformers.__version__}")
+
+    training_args._frozen = False
+
+    if not data_args.no_timestamps:
+        timestr = datetime.now().strftime("-%m%d%H%M")
+        training_args.output_dir = training_args.output_dir + timestr
+
+    training_args.logging_dir = os.path.join(training_args.output_dir, 'logging')
+
+    if os.path.exists(training_args.output_dir):
+        if training_args.overwrite_output_dir:
+            if training_args.process_index == 0:
+                shutil.rmtree(training_args.output_dir)
+        else:
+            raise ValueError(f"Output directory ({training_args.output_dir}) already exists. Use --overwrite_output_dir to overcome.")
+    
+    if training_args.world_size > 1:
+        dist.barrier()
+    
+    if training_args.process_index == 0:
+        os.makedirs(training_args.output_dir)
+    
+    if training_args.world_size > 1:
+        dist.barrier()
+    
+    set_seed(training_args.seed)
+
+    node_rank = int(os.getenv('GROUP_RANK', '0'))
+
+    for _logger in [logger, transformers.utils.logging.get_logger(), logging.getLogger('DeepSpeed')]:
+        set_logger(_logger, training_args.local_rank, data_args.stream, os.path.join(training_args.output_dir, f'log-node-{node_rank}.log'))
+
+    logger.warning("Device: %s, rank: %s, world size: %s", training_args.device, training_args.process_index, training_args.world_size)
+
+    if training_args.world_size > 1:
+        dist.barrier()
+
+    print_args(data_args, 'Data Arguments')
+    print_args(training_args, 'Training Arguments')
+
+    processor = PROCESSOR[data_args.processor](model_path=data_args.model_cfg)
+
+    config = AutoConfig.from_pretrained(data_args.model_cfg, trust_remote_code=True)
+    config.use_cache = False
+
+    if data_args.no_load_model_pararmeters:
+        model = AutoModelForCausalLM.from_config(config, trust_remote_code=True, attn_implementation = "flash_attention_2")
+    else:
+        model = AutoModelForCausalLM.from_pretrained(data_args.model_cfg, config=config, torch_dtype=torch.bfloat16, trust_remote_code=True, attn_implementation = "flash_attention_2")
+    # tokenizer = AutoTokenizer.from_pretrained(data_args.model_cfg, legacy=False, use_fast=True)
+    tokenizer = AutoTokenizer.from_pretrained(data_args.model_cfg, trust_remote_code=True)
+
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.pad_token_id = tokenizer.eos_token_id
+
+    resize(model, tokenizer, processor.get_special_token())
+    
+    train_sets = None
+    cache_path = None
+    if data_args.streaming_data:
+        if training_args.max_steps <= 0:
+            raise ValueError("--streaming_data needs --max_steps, the number of steps of a streamed dataset is unknown.")
+        if data_args.train_coef is not None:
+            logger.warning("--train_coef is ignored with --streaming_data")
+        train_sets = StreamingDialogueDataset(
+            list_data_files(data_args.train_file),
+            processor,
+            tokenizer,
+            max_len=data_args.max_len,
+            delete_long_sample=data_args.delete_long_sample,
+            token_budget=data_args.stream_token_budget,
+            buffer_size=data_args.stream_buffer_size,
+            seed=training_args.seed,
+        )
+    elif data_args.preprocess_cache_dir is not None:
+        cache_key, cache_info = preprocess_fingerprint(data_args, training_args.seed, tokenizer)
+        cache_path = os.path.join(data_args.preprocess_cache_dir, cache_key)
+        train_sets = load_cached_dataset(cache_path)
+
+    if train_sets is None:
+        train_sets = build_train_dataset(data_args, training_args, processor, tokenizer)
+        if cache_path is not None and training_args.process_index == 0:
+            save_cached_dataset(train_sets, cache_path, cache_info)
+
     trainer = Trainer(
         args=training_args,
         model=model,
         tokenizer=tokenizer,
         train_dataset=train_sets,
-        callbacks=[LoggerCallback, RemoveStateCallback],
+        callbacks=[
+            LoggerCallback,
+            RemoveStateCallback(
+                keep_last=data_args.keep_state_last,
+                keep_best=data_args.keep_best_state,
+                queue_size=data_args.prune_queue_size
+            )
+        ],
         data_collator=default_data_collator,
     )
 
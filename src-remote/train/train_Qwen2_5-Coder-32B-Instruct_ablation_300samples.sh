@@ -21,6 +21,7 @@ OMP_NUM_THREADS=1 torchrun --nnodes $WORLD_SIZE --node_rank $RANK --master_addr
 --remove_unused_columns False \
 --dataloader_num_workers 16 \
 --max_len 16384 \
+--preprocess_cache_dir data/preprocess_cache \
 --max_steps -1 \
 --num_train_epochs 2 \
 --save_strategy "epoch" \
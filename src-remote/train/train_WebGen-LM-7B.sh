@@ -21,6 +21,7 @@ OMP_NUM_THREADS=1 torchrun --nnodes 1 --node_rank 0 --nproc_per_node 8 $DIR/trai
 --remove_unused_columns False \
 --dataloader_num_workers 16 \
 --max_len 16384 \
+--preprocess_cache_dir data/preprocess_cache \
 --max_steps -1 \
 --num_train_epochs 2 \
 --save_strategy "epoch" \
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+logger = logging.getLogger()
+
+CACHE_DONE_FILE = 'PREPROCESS_DONE'
+CACHE_VERSION = 1
+
+
+def list_data_files(train_file):
+    files = []
+    for src in train_file.split(','):
+        if os.path.isdir(src):
+            files.extend(sorted(os.path.join(src, file) for file in os.listdir(src)))
+        else:
+            files.append(src)
+    return files
+
+
+def hash_file(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def hash_tokenizer(tokenizer):
+    sha = hashlib.sha256()
+    sha.update(type(tokenizer).__name__.encode())
+    sha.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode())
+    sha.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, default=str).encode())
+    sha.update(str(getattr(tokenizer, 'chat_template', None)).encode())
+    return sha.hexdigest()
+
+
+def preprocess_fingerprint(data_args, seed, tokenizer, extra=None):
+    """
+    Key of a preprocessed dataset: everything that changes the tokens fed to
+    the trainer. train_coef and seed are included because sampling and the
+    shuffle before grouping depend on them.
+    """
+    key = {
+        'version': CACHE_VERSION,
+        'tokenizer': hash_tokenizer(tokenizer),
+        'processor': data_args.processor,
+        'max_len': data_args.max_len,
+        'delete_long_sample': data_args.delete_long_sample,
+        'packing': data_args.packing,
+        'train_coef': data_args.train_coef,
+        'seed': seed,
+        'data_files': [[os.path.basename(f), hash_file(f)] for f in list_data_files(data_args.train_file)],
+        'extra': extra,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:24], key
+
+
+def load_cached_dataset(cache_path):
+    if not os.path.isfile(os.path.join(cache_path, CACHE_DONE_FILE)):
+        return None
+    from datasets import load_from_disk
+    logger.info('Loading preprocessed dataset from %s', cache_path)
+    return load_from_disk(cache_path)
+
+
+def save_cached_dataset(dataset, cache_path, key):
+    """Write to a temporary directory and rename, so readers never see a partial cache."""
+    tmp_path = cache_path + '.tmp-%d' % os.getpid()
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    dataset.save_to_disk(tmp_path)
+    with open(os.path.join(tmp_path, 'fingerprint.json'), 'w') as f:
+        json.dump(key, f, indent=2)
+    with open(os.path.join(tmp_path, CACHE_DONE_FILE), 'w') as f:
+        f.write('ok')
+    if os.path.exists(cache_path):
+        shutil.rmtree(cache_path)
+    os.rename(tmp_path, cache_path)
+    logger.info('Saved preprocessed dataset to %s', cache_path)
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 
 import re
+import bisect
 import torch
 import logging
+import numpy as np
 
 import copy
 from transformers import AutoTokenizer
@@ -20,6 +22,57 @@ def registry(name):
     
     return _registry
 
+def best_fit_decreasing(lengths, capacity):
+    """
+    Pack items of the given lengths into bins of `capacity` with best-fit
+    decreasing: longest item first, each into the fullest bin it still fits
+    in. Items longer than `capacity` are skipped. Returns lists of indices.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    remaining = []  # sorted (space_left, bin_id)
+    bins = []
+    for idx in order:
+        length = lengths[idx]
+        if length > capacity:
+            continue
+        pos = bisect.bisect_left(remaining, (length, -1))
+        if pos < len(remaining):
+            space, bin_id = remaining.pop(pos)
+        else:
+            space, bin_id = capacity, len(bins)
+            bins.append([])
+        bins[bin_id].append(idx)
+        bisect.insort(remaining, (space - length, bin_id))
+    return bins
+
+
+def greedy_bins(lengths, capacity):
+    # Mirrors BaseProcessor.group_texts.
+    bins, current, used = [], [], 0
+    for idx, length in enumerate(lengths):
+        if used + length > capacity:
+            bins.append(current)
+            current, used = [], 0
+        current.append(idx)
+        used += length
+    if current:
+        bins.append(current)
+    return bins
+
+
+def padding_ratio(lengths, capacity, batch_size, packing='greedy'):
+    """Fraction of padded tokens when packing per map batch of `batch_size` samples."""
+    pack = best_fit_decreasing if packing == 'best_fit' else greedy_bins
+    real = rows = 0
+    for start in range(0, len(lengths), batch_size):
+        batch = lengths[start:start + batch_size]
+        bins = pack(batch, capacity)
+        rows += len(bins)
+        real += sum(batch[i] for b in bins for i in b)
+    total = rows * capacity
+    return (total - real) / total if total else 0.0
+
+
 class BaseProcessor:
 
     def group_texts(self, examples, tokenizer, max_len):
@@ -47,14 +100,91 @@ class BaseProcessor:
             "labels": torch.tensor(final_labels).long()
         }
 
+    def pack_texts(self, examples, tokenizer, max_len):
+        """
+        Best-fit-decreasing packing of the samples in this batch into rows of
+        `max_len`. position_ids restart at 0 for every sample (and for the
+        padding tail), which flash-attention 2 turns into varlen boundaries so
+        packed samples do not attend to each other. The first label of each
+        sample is ignored so no sample is trained to predict the next one.
+        Samples longer than `max_len` (kept by --delete_long_sample) are
+        dropped, with a warning giving their number and tokens.
+        """
+        lengths = [len(_input_ids) for _input_ids in examples['input_ids']]
+        dropped = [length for length in lengths if length > max_len]
+        if dropped:
+            logger.warning(
+                "pack_texts dropped %d of %d samples (%d tokens) longer than %d tokens",
+                len(dropped), len(lengths), sum(dropped), max_len
+            )
+        final_input_ids, final_labels, final_position_ids = [], [], []
+
+        for bin_indices in best_fit_decreasing(lengths, max_len):
+            input_ids, labels, position_ids = [], [], []
+            for idx in bin_indices:
+                _labels = list(examples['labels'][idx])
+                _labels[0] = IGNORE_INDEX
+                input_ids.extend(examples['input_ids'][idx])
+                labels.extend(_labels)
+                position_ids.extend(range(lengths[idx]))
+
+            pad_num = max_len - len(input_ids)
+            final_input_ids.append(input_ids + [tokenizer.pad_token_id] * pad_num)
+            final_labels.append(labels + [IGNORE_INDEX] * pad_num)
+            final_position_ids.append(position_ids + list(range(pad_num)))
+
+        return {
+            "input_ids": torch.tensor(final_input_ids).long(),
+            "labels": torch.tensor(final_labels).long(),
+            "position_ids": torch.tensor(final_position_ids).long()
+        }
+
+
+def mask_labels_loop(tokens, token_strs):
+    """
+    Reference token-by-token masking of system/user segments, kept for
+    parity checks against DialogueProcessor.mask_labels.
+    """
+    labels = list(tokens)
+    ignore_segment = False  # flag indicating that we are in a segment to ignore
+    i = 0
+    while i < len(tokens):
+        token = token_strs[i]
+        # Check for the beginning of a message block
+        if token == '<|im_start|>':
+            # Look ahead for the role token (should be the next token)
+            if i + 1 < len(tokens):
+                role_token = token_strs[i+1].strip()  # remove any extraneous whitespace
+                if role_token in ['user', 'system']:
+                    # mark the role token itself as ignored
+                    labels[i+1] = IGNORE_INDEX
+                    ignore_segment = True
+                    # Move index forward so that the role token is processed and then continue.
+                    i += 2
+                    continue
+        # Check for the end marker
+        if token == '<|im_end|>':
+            if ignore_segment:
+                labels[i] = IGNORE_INDEX
+                ignore_segment = False
+                i += 1
+                continue
+        # If we are within an ignored segment, mark this token as ignore
+        if ignore_segment:
+            labels[i] = IGNORE_INDEX
+        i += 1
+    return labels
+
 
 @registry('qwen_agent')
 class DialogueProcessor(BaseProcessor):
 
     special_token = ['<|im_start|>', '<|im_end|>']
+    ignore_roles = ['user', 'system']
     
-    def __init__(self, model_path):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=False)
+    def __init__(self, model_path, use_fast=True):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, use_fast=use_fast)
+        self._special_ids = {}
 
     def get_special_token(self):
         return self.special_token
@@ -68,47 +198,60 @@ class DialogueProcessor(BaseProcessor):
         )
         return dict(text=text)
 
+    def get_special_ids(self, tokenizer):
+        """
+        Ids of <|im_start|>, <|im_end|> and of every vocab token that strips
+        to an ignored role name, looked up once per tokenizer.
+        """
+        key = id(tokenizer)
+        if key not in self._special_ids:
+            start_id, end_id = tokenizer.convert_tokens_to_ids(self.special_token)
+            role_ids = [
+                token_id for token, token_id in tokenizer.get_vocab().items()
+                if isinstance(token, str) and token.strip() in self.ignore_roles
+            ]
+            self._special_ids[key] = (start_id, end_id, np.array(sorted(role_ids), dtype=np.int64))
+        return self._special_ids[key]
+
+    def mask_labels(self, tokens, tokenizer):
+        """
+        Vectorized equivalent of mask_labels_loop.
+
+        A segment opens at the role token following <|im_start|> user/system
+        and closes at the next <|im_end|> (inclusive). A position is masked
+        when the latest opener at or before it comes after the latest
+        <|im_end|> strictly before it. The <|im_start|> preceding an opener is
+        never masked, matching the loop which skips over it.
+        """
+        start_id, end_id, role_ids = self.get_special_ids(tokenizer)
+        ids = np.asarray(tokens, dtype=np.int64)
+        n = len(ids)
+        if n == 0:
+            return []
+        positions = np.arange(n)
+
+        starts_role = np.zeros(n, dtype=bool)
+        starts_role[:-1] = (ids[:-1] == start_id) & np.isin(ids[1:], role_ids)
+        opener = np.zeros(n, dtype=bool)
+        opener[1:] = starts_role[:-1]
+
+        last_open = np.maximum.accumulate(np.where(opener, positions, -1))
+        last_end = np.maximum.accumulate(np.where(ids == end_id, positions, -1))
+        prev_end = np.empty(n, dtype=np.int64)
+        prev_end[0] = -1
+        prev_end[1:] = last_end[:-1]
+
+        mask = (last_open >= 0) & (last_open > prev_end) & ~starts_role
+        return np.where(mask, IGNORE_INDEX, ids).tolist()
+
     def process_tokenize(self, examples, tokenizer, max_len, delete_long_sample):
-        IGNORE_INDEX = -100  # constant to mark tokens that are ignored
         input_ids_list = []
         labels_list = []
-        
-        for text in examples['text']:
-            # Tokenize without truncation or padding yet
-            tokenized = tokenizer(text, truncation=False, padding=False)
-            tokens = tokenized['input_ids']
-            # Make a copy for labels
-            labels = tokens.copy()
-            # Convert token ids to token strings to locate special tokens and roles
-            token_strs = tokenizer.convert_ids_to_tokens(tokens)
-
-            ignore_segment = False  # flag indicating that we are in a segment to ignore
-            i = 0
-            while i < len(tokens):
-                token = token_strs[i]
-                # Check for the beginning of a message block
-                if token == '<|im_start|>':
-                    # Look ahead for the role token (should be the next token)
-                    if i + 1 < len(tokens):
-                        role_token = token_strs[i+1].strip()  # remove any extraneous whitespace
-                        if role_token in ['user', 'system']:
-                            # mark the role token itself as ignored
-                            labels[i+1] = IGNORE_INDEX
-                            ignore_segment = True
-                            # Move index forward so that the role token is processed and then continue.
-                            i += 2
-                            continue
-                # Check for the end marker
-                if token == '<|im_end|>':
-                    if ignore_segment:
-                        labels[i] = IGNORE_INDEX
-                        ignore_segment = False
-                        i += 1
-                        continue
-                # If we are within an ignored segment, mark this token as ignore
-                if ignore_segment:
-                    labels[i] = IGNORE_INDEX
-                i += 1
+
+        # Tokenize the whole batch at once (parallel in the Rust backend for fast tokenizers)
+        tokenized = tokenizer(examples['text'], truncation=False, padding=False)
+        for tokens in tokenized['input_ids']:
+            labels = self.mask_labels(tokens, tokenizer)
 
             # Handle length: if the tokenized sequence exceeds the maximum allowed length,
             # either truncate (if delete_long_sample is False) or (if deletion is enabled) leave it as is.
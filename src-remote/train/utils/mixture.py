@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import random
+import logging
+
+from torch.utils.data import Dataset
+
+logger = logging.getLogger()
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(x):
+    # splitmix64 finalizer
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class LazyPermutation:
+    """
+    Seeded pseudo-random permutation of range(n) computed per index with a
+    Feistel network and cycle walking, so no index array is ever built.
+    """
+
+    def __init__(self, n, seed, rounds=4):
+        self.n = n
+        bits = max((n - 1).bit_length(), 2)
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.keys = [_mix64(seed * 1000003 + r) for r in range(rounds)]
+
+    def _feistel(self, x):
+        left, right = x >> self.half_bits, x & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ (_mix64(right ^ key) & self.half_mask)
+        return (left << self.half_bits) | right
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.n:
+            raise IndexError(i)
+        x = self._feistel(i)
+        while x >= self.n:
+            x = self._feistel(x)
+        return x
+
+
+class MixtureDataset(Dataset):
+    """
+    Weighted mixture of sources stored back to back in `dataset`.
+
+    Source i contributes exactly `sample_nums[i]` samples per epoch: full
+    passes over the source plus a seeded random subset for the fractional
+    part, drawn like the original `indices * k + rand.sample(...)` scheme.
+    Positions are resolved arithmetically and shuffled through a
+    LazyPermutation, so memory does not grow with the upsampling factor.
+    """
+
+    def __init__(self, dataset, source_lengths, sample_nums, seed):
+        self.dataset = dataset
+        self.offsets, self.repeats, self.remainders, self.counts = [], [], [], []
+        rand = random.Random(seed)
+        offset = 0
+        for length, sample_num in zip(source_lengths, sample_nums):
+            length = int(length)
+            repeats = int(sample_num // length)
+            remainder = int(sample_num % length)
+            self.offsets.append(offset)
+            self.repeats.append(repeats)
+            self.remainders.append(rand.sample(range(length), remainder) if remainder > 0 else [])
+            self.counts.append(repeats * length + remainder)
+            offset += length
+        self.source_lengths = [int(length) for length in source_lengths]
+        self.starts = [sum(self.counts[:i]) for i in range(len(self.counts))]
+        self.total = sum(self.counts)
+        self.perm = LazyPermutation(self.total, seed)
+        logger.info("Mixture samples per epoch: %s (total %d)", self.counts, self.total)
+
+    def __len__(self):
+        return self.total
+
+    def locate(self, position):
+        """Map an unshuffled epoch position to (source, index within source)."""
+        for source in range(len(self.counts) - 1, -1, -1):
+            if position >= self.starts[source]:
+                break
+        local = position - self.starts[source]
+        full = self.repeats[source] * self.source_lengths[source]
+        if local < full:
+            return source, local % self.source_lengths[source]
+        return source, self.remainders[source][local - full]
+
+    def __getitem__(self, i):
+        source, local = self.locate(self.perm[i])
+        return self.dataset[self.offsets[source] + local]
+
+
+def generate_grouped_rows(blocks, mixture, group_fn, tokenizer, max_len):
+    """
+    Yield grouped rows for consecutive blocks of the shuffled mixture. Each
+    block is grouped on its own, like one batch of the grouping map.
+    """
+    for start, end in blocks:
+        rows = [mixture[i] for i in range(start, end)]
+        grouped = group_fn(
+            {
+                "input_ids": [row["input_ids"] for row in rows],
+                "labels": [row["labels"] for row in rows]
+            },
+            tokenizer=tokenizer,
+            max_len=max_len
+        )
+        for i in range(len(grouped["input_ids"])):
+            yield {key: value[i].tolist() for key, value in grouped.items()}
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import json
+import random
+import logging
+
+from torch.utils.data import IterableDataset, get_worker_info
+
+logger = logging.getLogger()
+
+
+class StreamingDialogueDataset(IterableDataset):
+    """
+    Reads JSONL shards lazily and tokenizes in the DataLoader workers, so
+    training starts without the up-front map passes over the whole dataset.
+
+    Shards are split across DataLoader workers. Each worker fills a buffer of
+    `buffer_size` tokenized samples and packs it with BaseProcessor.pack_texts
+    (best-fit decreasing, position_ids restarting per sample) into rows of
+    exactly `token_budget` tokens (default `max_len`), padded at the end. Batches
+    are therefore fixed-shape packed rows, the same as --packing best_fit but
+    streamed, and default_data_collator only stacks them; a fixed shape is what
+    accelerate needs to concatenate the per-rank batches it dispatches.
+
+    The dataset is not sharded per rank: for an IterableDataset accelerate
+    iterates it on the main process only and dispatches slices of each batch
+    to the other ranks (dispatch_batches=True).
+    """
+
+    def __init__(self, files, processor, tokenizer, max_len, delete_long_sample=False,
+                 token_budget=None, buffer_size=1024, seed=42):
+        self.files = list(files)
+        self.processor = processor
+        self.tokenizer = tokenizer
+        self.max_len = max_len
+        self.delete_long_sample = delete_long_sample
+        self.token_budget = token_budget or max_len
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _worker_files(self):
+        rand = random.Random(self.seed + self.epoch)
+        files = self.files[:]
+        rand.shuffle(files)
+        worker_info = get_worker_info()
+        if worker_info is None:
+            return files, rand
+        return files[worker_info.id::worker_info.num_workers], random.Random(self.seed + self.epoch + 1000 * (worker_info.id + 1))
+
+    def _iter_samples(self, files):
+        for path in files:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    text = self.processor.process_input(json.loads(line))['text']
+                    tokenized = self.processor.process_tokenize(
+                        {'text': [text]}, self.tokenizer, self.max_len, self.delete_long_sample
+                    )
+                    # samples longer than token_budget are dropped (and counted) by pack_texts
+                    yield tokenized['input_ids'][0], tokenized['labels'][0]
+
+    def _pack(self, buffer, rand):
+        packed = self.processor.pack_texts(
+            {"input_ids": [input_ids for input_ids, _ in buffer], "labels": [labels for _, labels in buffer]},
+            self.tokenizer, self.token_budget
+        )
+        order = list(range(len(packed["input_ids"])))
+        rand.shuffle(order)
+        for row in order:
+            yield {key: value[row] for key, value in packed.items()}
+
+    def __iter__(self):
+        files, rand = self._worker_files()
+        buffer = []
+        for sample in self._iter_samples(files):
+            buffer.append(sample)
+            if len(buffer) >= self.buffer_size:
+                yield from self._pack(buffer, rand)
+                buffer = []
+        if buffer:
+            yield from self._pack(buffer, rand)
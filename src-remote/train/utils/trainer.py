@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 import os
 import glob
+import time
+import queue
+import shutil
 import logging
 import datetime
+import threading
 
 from transformers import TrainerCallback
 
@@ -40,14 +44,61 @@ class LoggerCallback(TrainerCallback):
         )
 
 class RemoveStateCallback(TrainerCallback):
-
-    def remove_state(self, args, step):
+    """
+    Strips optimizer / DeepSpeed state from older checkpoints so only model
+    weights remain. Deletion runs on a background thread fed by a bounded
+    queue, so rank 0 returns from on_save right away instead of holding the
+    other ranks at the next collective while multi-GB states are removed.
+
+    Retention: the newest `keep_last` checkpoints keep their state, and with
+    `keep_best` so does state.best_model_checkpoint.
+    """
+
+    def __init__(self, keep_last=1, keep_best=False, queue_size=4):
+        self.keep_last = max(int(keep_last), 0)
+        self.keep_best = keep_best
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.saved_steps = []
+        self.save_start = None
+        self.worker = None
+
+    def _start_worker(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._prune_loop, name='checkpoint-pruner', daemon=True)
+            self.worker.start()
+
+    def _prune_loop(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                output_dir, step = item
+                start = time.time()
+                removed = self.remove_state(output_dir, step)
+                logger.info('Pruned state of checkpoint-%d (%d paths) in %.1fs', step, removed, time.time() - start)
+            except Exception as e:
+                logger.exception('Failed to prune checkpoint state: %s', e)
+            finally:
+                self.queue.task_done()
+
+    @staticmethod
+    def _safe_path(root, path):
+        # Never follow a link or relative path out of the output directory.
+        root = os.path.realpath(root)
+        real = os.path.realpath(path)
+        if real == root or os.path.commonpath([root, real]) != root:
+            logger.warning('Refusing to remove %s outside of %s', path, root)
+            return False
+        return True
+
+    def remove_state(self, output_dir, step):
         step = int(step)
 
         if step <= 0:
-            return
+            return 0
 
-        step_dir =  os.path.join(args.output_dir, f'checkpoint-{step}')
+        step_dir = os.path.join(output_dir, f'checkpoint-{step}')
         logger.info('Remove state in %s', step_dir)
 
         remove_paths = [
@@ -63,20 +114,70 @@ class RemoveStateCallback(TrainerCallback):
 
         remove_paths.extend(glob.glob(os.path.join(step_dir, 'rng_state_*.pth'))) # numpy random state
 
+        removed = 0
         for path in remove_paths:
-            if os.path.exists(path):
-                os.system('rm -rf %s' % path)
+            if not os.path.lexists(path) or not self._safe_path(output_dir, path):
+                continue
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError: # rotated away by save_total_limit meanwhile
+                    continue
+            removed += 1
+        return removed
+
+    def _is_best(self, args, state, step):
+        if not self.keep_best or state.best_model_checkpoint is None:
+            return False
+        best = os.path.realpath(state.best_model_checkpoint)
+        return best == os.path.realpath(os.path.join(args.output_dir, f'checkpoint-{step}'))
+
+    def _enqueue(self, args, steps):
+        self._start_worker()
+        for step in steps:
+            # Blocks only when `queue_size` prunes are already pending.
+            self.queue.put((args.output_dir, step))
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if state.is_world_process_zero and control.should_save:
+            self.save_start = time.time()
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        # save_strategy "epoch" decides to save here rather than in on_step_end
+        if state.is_world_process_zero and control.should_save:
+            self.save_start = time.time()
 
     def on_save(self, args, state, control, **kwargs):
 
         if not state.is_world_process_zero:
             return
-        
-        self.remove_state(args, state.global_step - state.save_steps)
+
+        start = time.time()
+        self.saved_steps.append(state.global_step)
+        keep = self.saved_steps[-self.keep_last:] if self.keep_last > 0 else []
+        expired = [step for step in self.saved_steps if step not in keep and not self._is_best(args, state, step)]
+        self.saved_steps = [step for step in self.saved_steps if step not in expired]
+        self._enqueue(args, expired)
+
+        if self.save_start is not None:
+            logger.info(
+                'Checkpoint %d: save %.1fs, prune enqueue %.2fs (%d pending)',
+                state.global_step, start - self.save_start, time.time() - start, self.queue.qsize()
+            )
+            self.save_start = None
     
     def on_train_end(self, args, state, control, **kwargs):
         
         if not state.is_world_process_zero:
             return
         
-        self.remove_state(args, state.global_step)
+        self._enqueue(args, [step for step in self.saved_steps if not self._is_best(args, state, step)])
+        self.saved_steps = []
+        if self.worker is not None:
+            start = time.time()
+            self.queue.put(None)
+            self.worker.join()
+            self.worker = None
+            logger.info('Waited %.1fs for checkpoint pruning to finish', time.time() - start)
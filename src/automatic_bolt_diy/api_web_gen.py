@@ -0,0 +1,154 @@
+import json
+import os
+import re
+import sys
+import time
+import shutil
+import zipfile
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from argparse import ArgumentParser
+
+from openai import OpenAI
+
+from generation_utils import read_instructions, report_latency
+from prompt_generate_artifect import systemPrompt
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bolt_common"))
+from bolt_actions import BoltActionParser
+
+# Generates apps by calling an OpenAI-compatible endpoint directly, without a
+# browser or a bolt.diy instance. Output matches what the bolt.diy UI run
+# saves: {idx:06d}.zip with the project tree and {idx:06d}.json with the
+# exported chat, so the ui_test_bolt pipeline consumes it unchanged.
+
+
+def clean_file_content(file_path, content):
+    # Same clean-up bolt.diy applies before writing a file action.
+    content = content.strip("\n")
+    if not file_path.endswith(".md"):
+        match = re.fullmatch(r'\s*```\w*\n(.*?)\n?```\s*', content, re.DOTALL)
+        if match:
+            content = match.group(1)
+    return content + "\n"
+
+
+def write_project_file(project_dir, file_path, content):
+    """Write one file action below project_dir; paths escaping it are refused."""
+    target = os.path.normpath(os.path.join(project_dir, file_path.lstrip("/")))
+    if os.path.commonpath([os.path.abspath(project_dir), os.path.abspath(target)]) != os.path.abspath(project_dir):
+        print(f"Skipping file outside of project: {file_path}")
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "w", encoding="utf-8", newline="") as f:
+        f.write(clean_file_content(file_path, content))
+
+
+def zip_project(project_dir, zip_path):
+    tmp_path = zip_path + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for root, _, files in os.walk(project_dir):
+            for file in files:
+                path = os.path.join(root, file)
+                zf.write(path, os.path.relpath(path, project_dir))
+    os.replace(tmp_path, zip_path)
+
+
+def api_web_gen(client, idx, instruction, download_dir, model, temperature=0.0, max_tokens=8192):
+    """Generate one app and save it as {idx:06d}.zip / {idx:06d}.json. Returns the status."""
+    zip_path = os.path.join(download_dir, f"{idx:06d}.zip")
+    json_path = os.path.join(download_dir, f"{idx:06d}.json")
+    if os.path.exists(zip_path) and os.path.exists(json_path):
+        print(f"Files {idx:06d}.json and {idx:06d}.zip already exist. Skipping generation.")
+        return "skipped"
+
+    project_dir = os.path.join(download_dir, ".gen", f"{idx:06d}")
+    if os.path.exists(project_dir):
+        shutil.rmtree(project_dir)
+    os.makedirs(project_dir)
+
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": systemPrompt},
+            {"role": "user", "content": instruction}
+        ],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        stream=True
+    )
+
+    parser = BoltActionParser()
+    response, num_files = [], 0
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        response.append(delta)
+        # Files are written as soon as their action closes, while the model keeps generating.
+        for action in parser.feed(delta):
+            if action.type == "file" and action.file_path:
+                write_project_file(project_dir, action.file_path, action.content)
+                num_files += 1
+
+    content = "".join(response)
+    if num_files:
+        zip_project(project_dir, zip_path)
+    shutil.rmtree(project_dir, ignore_errors=True)
+
+    chat = {
+        "messages": [
+            {"role": "user", "content": instruction},
+            {"role": "assistant", "content": content}
+        ],
+        "description": parser.title or "",
+        "exportDate": datetime.datetime.now().isoformat()
+    }
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(chat, f, ensure_ascii=False)
+
+    return "ok" if num_files else "incomplete"
+
+
+def main():
+    parser = ArgumentParser(description="Generate web apps through an OpenAI-compatible API, without bolt.diy.")
+    parser.add_argument("--api_base", default="http://localhost:8000/v1", help="OpenAI-compatible endpoint")
+    parser.add_argument("--api_key", default=os.environ.get("OPENAI_API_KEY", "EMPTY"))
+    parser.add_argument("--provider", default="API", help="Provider name, only used for the output directory")
+    parser.add_argument("--desired_model", default="Qwen2.5-Coder-32B-Instruct", help="Served model name")
+    parser.add_argument("--jsonl_path", default="data/test.jsonl", help="Path to the JSONL file")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max requests in flight")
+    parser.add_argument("--temperature", type=float, default=0.0)
+    parser.add_argument("--max_tokens", type=int, default=8192)
+    args = parser.parse_args()
+
+    download_dir = f"downloads/{args.provider}/{os.path.basename(args.desired_model)}_{os.path.basename(args.jsonl_path).split('.')[0]}".replace(":", "_")
+    os.makedirs(download_dir, exist_ok=True)
+
+    client = OpenAI(base_url=args.api_base, api_key=args.api_key)
+    results, lock = [], threading.Lock()
+
+    def run(idx, instruction):
+        start = time.time()
+        try:
+            status = api_web_gen(client, idx, instruction, download_dir, args.desired_model, args.temperature, args.max_tokens)
+        except Exception as e:
+            print(f"{idx:06d} failed: {e}")
+            status = "error"
+        latency = time.time() - start
+        print(f"{idx:06d} {status} in {latency:.1f}s")
+        with lock:
+            results.append({"idx": idx, "status": status, "latency": round(latency, 2)})
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as executor:
+        futures = [executor.submit(run, idx, instruction) for idx, instruction in read_instructions(args.jsonl_path)]
+        for future in as_completed(futures):
+            future.result()
+
+    report_latency(results, time.time() - start, os.path.join(download_dir, "generation_latency.jsonl"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import sys
 import time
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -6,8 +7,47 @@ from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import Select, WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bolt_common"))
+from download_wait import wait_for_download, is_partial_download
+
+
+def snapshot_downloads(download_dir):
+    """
+    Remove partial files left by an earlier timed-out download, then return the
+    current file names. Otherwise such a download could finish while the next
+    one is awaited and be taken for it.
+    """
+    for name in os.listdir(download_dir):
+        if is_partial_download(name):
+            try:
+                os.remove(os.path.join(download_dir, name))
+            except OSError:
+                pass
+    return set(os.listdir(download_dir))
+
+
+def save_download(download_dir, files_before, new_path, timeout):
+    """Wait for the download triggered after `files_before` and move it to `new_path`."""
+    # only files with the expected extension count, so a late .zip never passes for the .json
+    suffix = os.path.splitext(new_path)[1]
+    new_files = [name for name in wait_for_download(download_dir, files_before, timeout=timeout) if name.endswith(suffix)]
+    if len(new_files) != 1:
+        return False
+    old_path = os.path.join(download_dir, new_files[0])
+    if os.path.exists(new_path):
+        os.remove(new_path)  # Remove old file if it exists
+    os.replace(old_path, new_path)
+    return True
+
 def automatic_web_gen(idx, instruction, download_dir="downloads", url="http://localhost:5173/",
-    desired_model="/mnt/cache/sharemath/models/qwen/Qwen2.5-Coder-32B-Instruct", provider="OpenAILike"):
+    desired_model="/mnt/cache/sharemath/models/qwen/Qwen2.5-Coder-32B-Instruct", provider="OpenAILike",
+    headless=False, session_dir=None, download_timeout=60):
+    """
+    Generate one app through the bolt.diy UI and save {idx:06d}.zip / {idx:06d}.json
+    into download_dir. With session_dir, Chrome downloads into that private
+    directory first, so parallel sessions never see each other's files.
+    Returns "skipped", "ok" or "incomplete".
+    """
     print(f"Running automatic_web_gen with idx={idx}, instruction='{instruction}', download_dir='{download_dir}', url='{url}', desired_model='{desired_model}', provider='{provider}'")
     # ---------------------------------------
     # 1) Set up Chrome & your download folder
@@ -19,7 +59,12 @@ def automatic_web_gen(idx, instruction, download_dir="downloads", url="http://lo
 
     if os.path.exists(os.path.join(download_dir, f"{idx:06d}.json")) and os.path.exists(os.path.join(download_dir, f"{idx:06d}.zip")):
         print(f"Files {idx:06d}.json and {idx:06d}.zip already exist. Skipping download.")
-        return
+        return "skipped"
+
+    output_dir = download_dir
+    if session_dir is not None:
+        download_dir = os.path.abspath(session_dir)
+        os.makedirs(download_dir, exist_ok=True)
 
     # If you want to explicitly configure the download folder and disable popups:
     from selenium.webdriver.chrome.options import Options
@@ -28,7 +73,8 @@ def automatic_web_gen(idx, instruction, download_dir="downloads", url="http://lo
     # --- Headless mode ---
     # For Chrome ≥ 109, “--headless=new” is recommended.
     # If you’re on an older version, use "--headless" instead.
-    # chrome_options.add_argument("--headless=new")     # <‑‑ headless flag
+    if headless:
+        chrome_options.add_argument("--headless=new")     # <‑‑ headless flag
     chrome_options.add_argument("--window-size=1920,1080")  # helpful for some UIs
 
     prefs = {
@@ -38,6 +84,7 @@ def automatic_web_gen(idx, instruction, download_dir="downloads", url="http://lo
     }
     chrome_options.add_experimental_option("prefs", prefs)
     driver = webdriver.Chrome(options=chrome_options)
+    saved = 0
 
     try:
         driver.get(url)
@@ -122,24 +169,16 @@ def automatic_web_gen(idx, instruction, download_dir="downloads", url="http://lo
         #
         # --- STEP F: Download Code, rename to {idx:06d}.zip
         #
-        files_before = set(os.listdir(download_dir))
+        files_before = snapshot_downloads(download_dir)
         download_code_button = driver.find_element(
             By.XPATH, 
             "//button[contains(text(), 'Download Code')]"
         )
         download_code_button.click()
-        time.sleep(5)  # Wait for the code download
-
-        files_after = set(os.listdir(download_dir))
-        new_files = files_after - files_before
-        if len(new_files) == 1:
-            downloaded_file = new_files.pop()
-            old_path = os.path.join(download_dir, downloaded_file)
-            zip_name = f"{idx:06d}.zip"
-            new_path = os.path.join(download_dir, zip_name)
-            if os.path.exists(new_path):
-                os.remove(new_path)  # Remove old file if it exists
-            os.rename(old_path, new_path)
+
+        new_path = os.path.join(output_dir, f"{idx:06d}.zip")
+        if save_download(download_dir, files_before, new_path, download_timeout):
+            saved += 1
             print(f"Renamed code file to: {new_path}")
         else:
             print("Could not uniquely identify the downloaded code file.")
@@ -147,32 +186,24 @@ def automatic_web_gen(idx, instruction, download_dir="downloads", url="http://lo
         #
         # --- STEP G: Export Chat -> rename to {idx:06d}.json
         #
-        files_before = set(os.listdir(download_dir))
+        files_before = snapshot_downloads(download_dir)
         export_chat_button = driver.find_element(
             By.XPATH,
             "//button[@title='Export Chat']"
         )
         export_chat_button.click()
-        time.sleep(5)  # Wait for the chat download
-
-        files_after = set(os.listdir(download_dir))
-        new_files = files_after - files_before
-        if len(new_files) == 1:
-            downloaded_file = new_files.pop()
-            old_path = os.path.join(download_dir, downloaded_file)
-            json_name = f"{idx:06d}.json"
-            new_path = os.path.join(download_dir, json_name)
-            if os.path.exists(new_path):
-                os.remove(new_path)  # Remove old file if it exists
-            os.rename(old_path, new_path)
+
+        new_path = os.path.join(output_dir, f"{idx:06d}.json")
+        if save_download(download_dir, files_before, new_path, download_timeout):
+            saved += 1
             print(f"Renamed chat file to: {new_path}")
         else:
             print("Could not uniquely identify the downloaded chat file.")
 
-        time.sleep(1)
-
     finally:
         driver.quit()
 
+    return "ok" if saved == 2 else "incomplete"
+
 if __name__ == "__main__":
     main(idx=1)
@@ -1,54 +1,89 @@
-import json
 import os
+import time
+import queue
+import threading
 from argparse import ArgumentParser
 
 # Import the function from remove_node_modules.py
 from automatic_web_gen import automatic_web_gen
 from remove_invalid_through_extract import process_directory
+from generation_utils import read_instructions, report_latency
+
+
+def run_session(session_id, url, jobs, results, lock, args, download_dir):
+    """One bolt.diy browser session: take instructions off the shared queue until it is empty."""
+    session_dir = os.path.join(download_dir, f".session{session_id}")
+    while True:
+        try:
+            idx, instruction = jobs.get_nowait()
+        except queue.Empty:
+            return
+
+        start = time.time()
+        try:
+            status = automatic_web_gen(
+                idx=idx,
+                instruction=instruction,
+                download_dir=download_dir,
+                url=url,
+                desired_model=args.desired_model,
+                provider=args.provider,
+                headless=args.headless,
+                session_dir=session_dir,
+                download_timeout=args.download_timeout
+            )
+        except Exception as e:
+            print(f"[session {session_id}] {idx:06d} failed: {e}")
+            status = "error"
+        latency = time.time() - start
+
+        print(f"[session {session_id}] {idx:06d} {status} in {latency:.1f}s")
+        with lock:
+            results.append({"idx": idx, "session": session_id, "url": url, "status": status, "latency": round(latency, 2)})
+
 
 def main():
     parser = ArgumentParser(description="Process JSONL file and generate web content.")
     parser.add_argument("--provider", default="OpenAILike", help="Provider name")
     parser.add_argument("--desired_model", default="Qwen2.5-Coder-32B-Instruct", help="Desired model path")
     parser.add_argument("--jsonl_path", default="data/test.jsonl", help="Path to the JSONL file")
-    parser.add_argument("--url", default="http://localhost:5173/", help="bolt.diy url")
+    parser.add_argument("--url", default="http://localhost:5173/",
+                        help="bolt.diy url; comma-separate several instances to spread sessions across them")
+    parser.add_argument("--num_sessions", type=int, default=1, help="Number of parallel browser sessions")
+    parser.add_argument("--headless", action="store_true", help="Run Chrome headless")
+    parser.add_argument("--download_timeout", type=float, default=60, help="Max seconds to wait for each download")
     args = parser.parse_args()
     # Adjust these if you want different defaults
     provider = args.provider
     desired_model = args.desired_model
-    url = args.url
+    urls = [url.strip() for url in args.url.split(",") if url.strip()]
 
     download_dir = f"downloads/{provider}/{os.path.basename(desired_model)}_{os.path.basename(args.jsonl_path).split('.')[0]}".replace(":", "_")
 
-    # Replace with the actual path to the jsonl file
-    jsonl_path = args.jsonl_path
-
     # Ensure the download_dir exists (optional)
     os.makedirs(download_dir, exist_ok=True)
     process_directory(download_dir)  # Clean up the download directory first
 
-    idx = 1
-    # Read the JSONL file line by line
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue  # Skip empty lines if any
+    jobs = queue.Queue()
+    for job in read_instructions(args.jsonl_path):
+        jobs.put(job)
 
-            record = json.loads(line)
-            instruction = record.get("instruction", "")
-
-            # Call automatic_web_gen for each record
-            automatic_web_gen(
-                idx=idx,
-                instruction=instruction,
-                download_dir=download_dir,
-                url=url,
-                desired_model=desired_model,
-                provider=provider
-            )
+    results, lock = [], threading.Lock()
+    start = time.time()
+    sessions = [
+        threading.Thread(
+            target=run_session,
+            args=(i, urls[i % len(urls)], jobs, results, lock, args, download_dir),
+            daemon=True
+        )
+        for i in range(max(args.num_sessions, 1))
+    ]
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join()
 
-            idx += 1
+    report_latency(results, time.time() - start, os.path.join(download_dir, "generation_latency.jsonl"))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,35 @@
+import json
+import statistics
+
+
+def read_instructions(jsonl_path):
+    """(idx, instruction) pairs, idx counting non-empty lines from 1."""
+    jobs = []
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue  # Skip empty lines if any
+            record = json.loads(line)
+            jobs.append((len(jobs) + 1, record.get("instruction", "")))
+    return jobs
+
+
+def report_latency(results, wall_time, path):
+    results = sorted(results, key=lambda r: r["idx"])
+    with open(path, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    generated = [r["latency"] for r in results if r["status"] != "skipped"]
+    print(f"{len(results)} apps in {wall_time:.1f}s, per-app latency written to {path}")
+    if generated:
+        generated.sort()
+        print(
+            f"generated {len(generated)}: mean {statistics.mean(generated):.1f}s, "
+            f"median {statistics.median(generated):.1f}s, max {generated[-1]:.1f}s"
+        )
+    for status in ("incomplete", "error"):
+        failed = [r["idx"] for r in results if r["status"] == status]
+        if failed:
+            print(f"{status}: {failed}")
@@ -0,0 +1,167 @@
+import os
+import json
+import zipfile
+import mimetypes
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+from tqdm import tqdm
+
+# Shared by the bolt.diy generation, UI-test and appearance-grading scripts.
+# Generated apps arrive as one zip per app. Extraction is parallel and skipped
+# when the archive has not changed since the last run. Opt-in
+# (--serve_static_from_zip): static apps are served straight from the zip
+# instead of through the model's start command, which changes scoring.
+
+MARKER_FILE = ".extracted.json"
+# Top-level entries that every template ships; an app with nothing else is empty.
+SCAFFOLD_PREFIXES = ("package",)
+SCAFFOLD_NAMES = ("node_modules", "start-wrapper.cjs", MARKER_FILE)
+
+
+def _archive_stamp(zip_path):
+    stat = os.stat(zip_path)
+    return {"zip": os.path.basename(zip_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def is_extracted(zip_path, output_dir):
+    """True when output_dir holds an extraction of this exact archive (same size and mtime)."""
+    marker = os.path.join(output_dir, MARKER_FILE)
+    if not os.path.isfile(marker):
+        return False
+    try:
+        with open(marker, "r", encoding="utf-8") as f:
+            return json.load(f) == _archive_stamp(zip_path)
+    except (OSError, ValueError):
+        return False
+
+
+def extract_archive(zip_path, output_dir):
+    """Extract one archive unless it is up to date. Returns "skipped", "extracted" or "error"."""
+    try:
+        if is_extracted(zip_path, output_dir):
+            return "skipped"
+        os.makedirs(output_dir, exist_ok=True)
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(output_dir)
+        # Written last, so an interrupted extraction is redone next time.
+        with open(os.path.join(output_dir, MARKER_FILE), "w", encoding="utf-8") as f:
+            json.dump(_archive_stamp(zip_path), f)
+        return "extracted"
+    except Exception as e:
+        print(f"Error extracting {zip_path} to {output_dir}: {e}")
+        return "error"
+
+
+def unzip_files(zip_file_paths, output_root, num_workers=8):
+    """
+    Extract each .zip into output_root/<zip name> on a thread pool, skipping
+    archives whose extraction is up to date. Returns {zip path: status}.
+    """
+    os.makedirs(output_root, exist_ok=True)
+    statuses = {}
+    with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as executor:
+        futures = {
+            executor.submit(extract_archive, zip_path, os.path.join(output_root, os.path.splitext(os.path.basename(zip_path))[0])): zip_path
+            for zip_path in zip_file_paths
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            statuses[futures[future]] = future.result()
+    counts = {status: list(statuses.values()).count(status) for status in set(statuses.values())}
+    print(f"Extracted archives: {counts}")
+    return statuses
+
+
+def list_archive(zip_path):
+    """File names in the archive, without directory entries."""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return [name for name in zip_ref.namelist() if not name.endswith("/")]
+
+
+def top_level_entries(names):
+    return sorted({name.split("/", 1)[0] for name in names})
+
+
+def has_app_files(names):
+    """Whether the archive holds anything besides package files and runner scaffolding."""
+    return any(
+        not entry.startswith(SCAFFOLD_PREFIXES) and entry not in SCAFFOLD_NAMES
+        for entry in top_level_entries(names)
+    )
+
+
+def is_static_app(names):
+    """A plain HTML/JS app that needs no install or dev server."""
+    return "index.html" in names and "package.json" not in names
+
+
+def split_static_apps(zip_file_paths):
+    """
+    (static app zips, unreadable zips). A corrupt or truncated archive is
+    logged and reported instead of aborting the whole run.
+    """
+    static, broken = set(), []
+    for zip_path in zip_file_paths:
+        try:
+            if is_static_app(list_archive(zip_path)):
+                static.add(zip_path)
+        except (zipfile.BadZipFile, OSError) as e:
+            print(f"Skipping unreadable archive {zip_path}: {e}")
+            broken.append(zip_path)
+    return static, broken
+
+
+def read_archive_file(zip_path, name):
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return zip_ref.read(name)
+
+
+class _ZipHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        path = posixpath.normpath(unquote(urlsplit(self.path).path)).lstrip("/")
+        if path in ("", "."):
+            path = "index.html"
+        names = self.server.names
+        if path not in names and posixpath.join(path, "index.html") in names:
+            path = posixpath.join(path, "index.html")
+        if path not in names:
+            if posixpath.splitext(path)[1]:
+                self.send_error(404)
+                return
+            path = "index.html"  # client-side routes fall back to the entry page
+        with self.server.lock:
+            body = self.server.archive.read(path)
+        self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_archive(zip_path, port=0):
+    """
+    Serve a static app directly from its zip on localhost in a background
+    thread. Returns the server; its port is server.server_address[1]. Stop it
+    with server.shutdown() and server.server_close().
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _ZipHandler)
+    server.daemon_threads = True
+    server.archive = zipfile.ZipFile(zip_path, 'r')
+    server.names = set(name for name in server.archive.namelist() if not name.endswith("/"))
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_servers(servers):
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+        server.archive.close()
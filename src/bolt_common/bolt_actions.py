@@ -0,0 +1,159 @@
+import os
+import re
+import json
+from collections import namedtuple
+
+from tqdm import tqdm
+
+# One parser for bolt's <boltArtifact>/<boltAction> markup, shared by
+# generation (streamed responses) and evaluation (shell/start commands of the
+# exported chat). src-remote is deployed separately and does not import it.
+
+TAG = re.compile(r'<(boltArtifact|boltAction)\b([^>]*)>|</boltAction>')
+ATTR = re.compile(r'(\w+)="([^"]*)"')
+
+# type is "file", "shell" or "start"; start/end are offsets of the whole
+# <boltAction ...>...</boltAction> element in the parsed text.
+BoltAction = namedtuple("BoltAction", ["type", "file_path", "content", "start", "end"])
+
+
+class BoltActionParser:
+    """
+    Single-pass, incremental parser. feed() takes text as it arrives and
+    returns the actions completed so far; only the unparsed tail is kept.
+    Artifact titles seen so far are in `titles`.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.offset = 0  # stream position of buffer[0]
+        self.open = None  # (attrs, start, content start) of the action being read
+        self.scan_from = 0  # buffer position where the next scan resumes
+        self.titles = []
+
+    def _consume(self, end):
+        self.buffer = self.buffer[end:]
+        self.offset += end
+
+    def feed(self, text):
+        self.buffer += text
+        actions = []
+        pos = 0
+        for match in TAG.finditer(self.buffer, self.scan_from):
+            if match.group(1) is None:  # </boltAction>
+                if self.open is not None:
+                    attrs, start, content_start = self.open
+                    actions.append(BoltAction(
+                        attrs.get("type"),
+                        attrs.get("filePath"),
+                        self.buffer[content_start - self.offset:match.start()],
+                        start,
+                        self.offset + match.end()
+                    ))
+                    self.open = None
+            elif self.open is None:
+                attrs = dict(ATTR.findall(match.group(2)))
+                if match.group(1) == "boltArtifact":
+                    self.titles.append(attrs.get("title"))
+                else:
+                    self.open = (attrs, self.offset + match.start(), self.offset + match.end())
+            pos = match.end()
+
+        if self.open is not None:
+            # keep the open action's content, but only rescan where a closing tag could start
+            self._consume(self.open[2] - self.offset)
+            self.scan_from = max(len(self.buffer) - len("</boltAction>") + 1, 0)
+        else:
+            # keep a possibly partial tag at the end
+            tail = self.buffer.rfind("<", pos)
+            self._consume(tail if tail != -1 else len(self.buffer))
+            self.scan_from = 0
+        return actions
+
+    @property
+    def title(self):
+        return next((title for title in self.titles if title), None)
+
+
+def parse_bolt_actions(text):
+    """All complete actions in text, in order."""
+    return BoltActionParser().feed(text)
+
+
+def extract_bolt_actions(text):
+    """(shell action contents, content of the last start action or "")."""
+    actions = parse_bolt_actions(text)
+    shell_actions = [action.content for action in actions if action.type == "shell"]
+    start_actions = [action.content for action in actions if action.type == "start"]
+    return shell_actions, start_actions[-1] if start_actions else ""
+
+
+_MESSAGES_KEY = re.compile(r'"messages"\s*:\s*\[')
+
+
+def iter_chat_messages(json_path, chunk_size=1 << 20):
+    """
+    Yield the messages of a bolt chat export one at a time, reading the file
+    in chunks, so only one message is held in memory at a time.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_path, "r", encoding="utf-8") as f:
+        buffer = ""
+        while True:
+            match = _MESSAGES_KEY.search(buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buffer = buffer[-32:] + chunk
+
+        eof = False
+        while True:
+            stripped = buffer.lstrip(" \t\r\n,")
+            if stripped.startswith("]"):
+                return
+            if stripped:
+                try:
+                    message, end = decoder.raw_decode(stripped)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield message
+                    buffer = stripped[end:]
+                    continue
+            elif eof:
+                raise ValueError(f"Unterminated messages array in {json_path}")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = stripped + chunk
+
+
+def last_chat_message(json_path):
+    message = None
+    for message in iter_chat_messages(json_path):
+        pass
+    return message
+
+
+def message_text(message):
+    """Text of a chat message whose content is a string or a list of parts."""
+    content = message.get("content", "") if message else ""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def get_shell_start(zip_file_paths, output_root):
+    """Install and start commands of each app, from the last message of its exported chat."""
+    commands = {}
+    for zip_file in tqdm(zip_file_paths):
+        message = last_chat_message(zip_file.replace(".zip", ".json"))
+        shell_actions, last_start_action = extract_bolt_actions(message_text(message))
+        commands[os.path.basename(zip_file).replace(".zip", "")] = {"shell_actions": shell_actions, "last_start_action": last_start_action}
+
+    with open(os.path.join(output_root, "commands.json"), "w", encoding="utf-8") as f:
+        json.dump(commands, f)
+    return commands
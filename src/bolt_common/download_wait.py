@@ -0,0 +1,48 @@
+import os
+import time
+import logging
+
+# Waits for a Chrome download to finish instead of sleeping a fixed time.
+# Chrome writes "<name>.crdownload" and renames it once complete. Used by the
+# bolt.diy generation scripts; WebVoyager has its own DownloadWatcher, since
+# the two are deployed and run separately.
+
+PARTIAL_SUFFIXES = (".crdownload", ".part", ".tmp")
+
+
+def is_partial_download(name):
+    return name.endswith(PARTIAL_SUFFIXES)
+
+
+def wait_for_download(directory, files_before, timeout=60, poll_interval=0.2, stable_time=0.5):
+    """
+    Wait for downloads that started after `files_before` (a set of names from
+    os.listdir) to finish. Returns the new complete file names as soon as they
+    are stable, or the complete ones seen so far after `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    sizes, stable_since = {}, None
+    while True:
+        new = set(os.listdir(directory)) - set(files_before)
+        finished = sorted(name for name in new if not is_partial_download(name) and not name.startswith("."))
+        pending = any(is_partial_download(name) for name in new)
+
+        current = {}
+        for name in finished:
+            try:
+                current[name] = os.path.getsize(os.path.join(directory, name))
+            except OSError:  # renamed or removed between listdir and stat
+                pending = True
+        if finished and not pending and current == sizes:
+            if stable_since is None:
+                stable_since = time.monotonic()
+            elif time.monotonic() - stable_since >= stable_time:
+                return finished
+        else:
+            stable_since = None
+        sizes = current
+
+        if time.monotonic() >= deadline:
+            logging.warning("Timed out after %ss waiting for a download in %s", timeout, directory)
+            return finished
+        time.sleep(poll_interval)
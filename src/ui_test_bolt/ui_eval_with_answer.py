@@ -1,10 +1,7 @@
 import os
-import zipfile
 from tqdm import tqdm
 import time
 
-import re
-from typing import List, Tuple
 import json
 
 import subprocess
@@ -13,6 +10,10 @@ import sys
 
 from start_service import start_services
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bolt_common"))
+from app_archive import unzip_files, split_static_apps, serve_archive, stop_servers
+from bolt_actions import get_shell_start
+
 
 def load_json(in_file):
     with open(in_file, "r", encoding="utf-8") as f:
@@ -39,63 +40,6 @@ def save_jsonl(datas, out_file, mode="w"):
             f.write(json.dumps(data, ensure_ascii=False) + "\n")
 
 
-def extract_bolt_actions(text: str) -> Tuple[List[str], str]:
-    # Extract all shell actions
-    shell_actions = re.findall(r'<boltAction type="shell">(.*?)</boltAction>', text, re.DOTALL)
-
-    # Extract all start actions
-    start_actions = re.findall(r'<boltAction type="start">(.*?)</boltAction>', text, re.DOTALL)
-
-    # Get the last start action, if any
-    last_start_action = start_actions[-1] if start_actions else ""
-
-    return shell_actions, last_start_action
-
-
-def unzip_files(zip_file_paths, output_root):
-    """
-    Given a list of .zip files and a desired output root directory,
-    unzip each file into a subdirectory named after the .zip file.
-    
-    :param zip_file_paths: List of paths to .zip files (e.g. ["path/to/file1.zip", "path/to/file2.zip"]).
-    :param output_root: Output root directory where extracted folders will be created.
-    """
-    # Ensure the output_root exists
-    if not os.path.exists(output_root):
-        os.makedirs(output_root)
-    
-    for zip_path in tqdm(zip_file_paths):
-
-        try:
-            # Get the base name of the zip file (e.g. "my_archive" from "my_archive.zip")
-            base_name = os.path.splitext(os.path.basename(zip_path))[0]
-            
-            # Construct the output folder path
-            output_dir = os.path.join(output_root, base_name)
-            
-            # Create the output directory if it doesn't exist
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            
-            # Extract all contents of the zip file into the output directory
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(output_dir)
-        except:
-            print(f"Error extracting {zip_path} to {output_dir}")
-
-
-def get_shell_start(zip_file_paths, output_root):
-    commands = {}
-    for zip_file in tqdm(zip_file_paths):
-        json_file = zip_file.replace(".zip", ".json")
-        data = load_json(json_file)
-        shell_actions, last_start_action = extract_bolt_actions(data["messages"][-1]["content"])
-        commands[os.path.basename(zip_file).replace(".zip", "")] = {"shell_actions": shell_actions, "last_start_action": last_start_action}
-
-    save_json(commands, os.path.join(output_root, "commands.json"))
-    return commands
-
-
 ui_prompt_template = """
 
 Task: {task}
@@ -165,6 +109,10 @@ def main():
     from argparse import ArgumentParser
     parser = ArgumentParser()
     parser.add_argument("--in_dir", type=str)
+    parser.add_argument("--serve_static_from_zip", action="store_true",
+                        help="Serve apps with index.html and no package.json straight from the zip instead of running "
+                             "the model's start command under pm2. Changes scoring: an app with a broken or missing "
+                             "start action becomes reachable, so results are not comparable to runs without this flag.")
     args = parser.parse_args()
     in_dir = args.in_dir
     test_file = "data/test.jsonl"
@@ -180,23 +128,40 @@ def main():
     if os.path.isfile(log_file):
         log_datas = load_jsonl(log_file)
         
-    zip_files = zip_files[len(log_datas):]
-
-    unzip_files(zip_files, output_root)
+    done_zip_files = set(log_data["app_path"] for log_data in log_datas)
+    zip_files = [zip_file for zip_file in zip_files if zip_file not in done_zip_files]
+
+    # By default every app is started with its own start command, as in the published runs. With
+    # --serve_static_from_zip, static apps are served straight from their zip; only the rest need extracting, npm and pm2.
+    static_zip_files, broken_zip_files = split_static_apps(zip_files)
+    if not args.serve_static_from_zip:
+        static_zip_files = set()
+    if broken_zip_files:
+        save_jsonl([{"app_path": zip_file, "error": "unreadable archive"} for zip_file in broken_zip_files], log_file, mode="a")
+        zip_files = [zip_file for zip_file in zip_files if zip_file not in broken_zip_files]
+    unzip_files([zip_file for zip_file in zip_files if zip_file not in static_zip_files], output_root)
 
     subprocess.run("pm2 delete all", shell=True)
 
     batch_size = 5
     for i in tqdm(range(0, len(zip_files), batch_size)):
         batch_zip_files = zip_files[i:i + batch_size]
-        commands = get_shell_start(batch_zip_files, output_root)
-        ports = start_services(output_root, commands)
+        servers = {
+            os.path.basename(zip_file).replace(".zip", ""): serve_archive(zip_file)
+            for zip_file in batch_zip_files if zip_file in static_zip_files
+        }
+        ports = {app: server.server_address[1] for app, server in servers.items()}
+        node_zip_files = [zip_file for zip_file in batch_zip_files if zip_file not in static_zip_files]
+        if node_zip_files:
+            commands = get_shell_start(node_zip_files, output_root)
+            ports.update(start_services(output_root, commands) or {})
         print(ports)
 
         create_tasks_test(test_file, ports, tasks_file)
         run_webvoyager(output_root)
         
         subprocess.run("pm2 delete all", shell=True)
+        stop_servers(servers.values())
         
         curr_log_datas = [{"app_path": app_path} for app_path in batch_zip_files]
         save_jsonl(curr_log_datas, log_file, mode="a")
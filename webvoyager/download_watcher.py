@@ -0,0 +1,110 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import time
+
+
+# Wakes up when Chrome finishes a download instead of sleeping a fixed time.
+# Chrome writes "<name>.crdownload" and renames it once complete, so on Linux
+# an inotify watch on the directory fires exactly at completion. Elsewhere
+# (no inotify, e.g. Windows/macOS) we fall back to a short-interval rescan.
+
+PARTIAL_SUFFIXES = (".crdownload", ".part", ".tmp")
+
+_IN_CREATE = 0x00000100
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+
+
+def _inotify_open(directory):
+    """Return an inotify fd watching *directory*, or None if unavailable."""
+    if not hasattr(os, "O_NONBLOCK"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        wd = libc.inotify_add_watch(
+            fd, os.fsencode(directory), _IN_CREATE | _IN_CLOSE_WRITE | _IN_MOVED_TO
+        )
+        if wd < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def is_partial_download(name):
+    return name.endswith(PARTIAL_SUFFIXES)
+
+
+class DownloadWatcher:
+    def __init__(self, directory, poll_interval=0.2):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+        self.known = set(os.listdir(directory))
+        self._fd = _inotify_open(directory)
+        logging.info(
+            "Watching %s for downloads (%s)", directory, "inotify" if self._fd is not None else "polling"
+        )
+
+    def _drain(self, timeout):
+        if self._fd is None:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self._fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def _new_entries(self):
+        return set(os.listdir(self.directory)) - self.known
+
+    def _interval(self):
+        return 1.0 if self._fd is not None else self.poll_interval
+
+    def wait_for_downloads(self, timeout=60, start_timeout=3):
+        """Return the files that finished downloading since the last call.
+
+        Waits up to *start_timeout* seconds for a download to appear and
+        returns [] if none does. Otherwise blocks until the new partial files
+        are gone or *timeout* seconds pass. Partial files left behind by a
+        timed-out download are not waited on again.
+        """
+        start_deadline = time.monotonic() + start_timeout
+        new = self._new_entries()
+        while not new:
+            remaining = start_deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            self._drain(min(remaining, self._interval()))
+            new = self._new_entries()
+
+        deadline = time.monotonic() + timeout
+        while True:
+            partial = [name for name in self._new_entries() if is_partial_download(name)]
+            if not partial:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logging.warning("Timed out waiting for downloads in %s", self.directory)
+                self.known.update(partial)
+                break
+            self._drain(min(remaining, self._interval()))
+        new = self._new_entries()
+        finished = sorted(name for name in new if not is_partial_download(name))
+        self.known.update(finished)
+        return finished
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
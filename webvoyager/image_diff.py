@@ -0,0 +1,117 @@
+import numpy as np
+from PIL import Image
+
+
+# Screenshot comparison used by the agent loop to notice actions that did not
+# change the page. Pixels are compared as int16 so the subtraction cannot wrap
+# around, and rows are processed in blocks so no full-size temporary is kept.
+
+
+def load_image_array(image, scale=1, grayscale=True):
+    """Load *image* (path or PIL image) as an int16 array, optionally downsampled."""
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    if grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGB")
+    if scale > 1:
+        image = image.reduce(scale)
+    return np.asarray(image, dtype=np.int16)
+
+
+def _label_boxes(tile_mask, tile, scale, height, width):
+    """Group changed tiles into 4-connected regions and return their pixel boxes."""
+    rows, cols = tile_mask.shape
+    seen = np.zeros_like(tile_mask)
+    boxes = []
+    for r0, c0 in zip(*np.nonzero(tile_mask)):
+        if seen[r0, c0]:
+            continue
+        seen[r0, c0] = True
+        stack = [(r0, c0)]
+        top, left, bottom, right = r0, c0, r0, c0
+        while stack:
+            r, c = stack.pop()
+            top, bottom = min(top, r), max(bottom, r)
+            left, right = min(left, c), max(right, c)
+            for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if 0 <= nr < rows and 0 <= nc < cols and tile_mask[nr, nc] and not seen[nr, nc]:
+                    seen[nr, nc] = True
+                    stack.append((nr, nc))
+        step = tile * scale
+        boxes.append((
+            int(left * step),
+            int(top * step),
+            int(min((right + 1) * step, width)),
+            int(min((bottom + 1) * step, height)),
+        ))
+    return boxes
+
+
+def diff_images(img1, img2, scale=4, grayscale=True, pixel_tol=8, stop_ratio=None,
+                tile=8, block_rows=64):
+    """Compare two screenshots and describe where they differ.
+
+    *scale* downsamples both images before comparing and *pixel_tol* ignores
+    small intensity changes (anti-aliasing, caret blink). When *stop_ratio* is
+    given, scanning stops as soon as the changed-pixel ratio is known to exceed
+    it; the result is then marked incomplete and its boxes only cover the rows
+    scanned so far.
+
+    Returns a dict with ``changed``, ``changed_ratio``, ``total_difference``,
+    ``boxes`` (``(left, top, right, bottom)`` in original pixel coordinates)
+    and ``complete``.
+    """
+    a = load_image_array(img1, scale, grayscale)
+    b = load_image_array(img2, scale, grayscale)
+    if a.shape != b.shape:
+        height, width = a.shape[0] * scale, a.shape[1] * scale
+        return {
+            "changed": True,
+            "changed_ratio": 1.0,
+            "total_difference": None,
+            "boxes": [(0, 0, width, height)],
+            "complete": True,
+        }
+
+    height, width = a.shape[:2]
+    n_pixels = height * width
+    stop_pixels = None if stop_ratio is None else stop_ratio * n_pixels
+    mask = np.zeros((height, width), dtype=bool)
+    changed_pixels = 0
+    total_difference = 0
+    complete = True
+
+    for start in range(0, height, block_rows):
+        d = np.abs(a[start:start + block_rows] - b[start:start + block_rows])
+        total_difference += int(d.sum(dtype=np.int64))
+        if d.ndim == 3:
+            d = d.max(axis=2)
+        block_mask = d > pixel_tol
+        mask[start:start + block_rows] = block_mask
+        changed_pixels += int(block_mask.sum())
+        if stop_pixels is not None and changed_pixels > stop_pixels:
+            complete = start + block_rows >= height
+            break
+
+    changed_ratio = changed_pixels / n_pixels if n_pixels else 0.0
+    if stop_pixels is None:
+        changed = changed_pixels > 0
+    else:
+        changed = changed_pixels > stop_pixels
+
+    boxes = []
+    if changed_pixels:
+        pad_h, pad_w = (-height) % tile, (-width) % tile
+        padded = np.pad(mask, ((0, pad_h), (0, pad_w)))
+        tile_mask = padded.reshape(padded.shape[0] // tile, tile, padded.shape[1] // tile, tile).any(axis=(1, 3))
+        boxes = _label_boxes(tile_mask, tile, scale, height * scale, width * scale)
+
+    return {
+        "changed": changed,
+        "changed_ratio": changed_ratio,
+        "total_difference": total_difference,
+        "boxes": boxes,
+        "complete": complete,
+    }
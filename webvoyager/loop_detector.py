@@ -0,0 +1,45 @@
+import logging
+
+
+# Detects agents that keep issuing the same action on the same element while
+# the page stays the same, e.g. repeating `Click [3]` until max_iter.
+
+LOOP_POLICIES = ["off", "warn", "verdict", "stop"]
+
+loop_warn_template = (
+    "Warning: you have chosen the same action ({action}) {repeat} times in a row and the page did not change. "
+    "Do NOT repeat it; choose a different element or action, or ANSWER if you can already judge the result."
+)
+
+
+def action_target(action_key, info):
+    """Return a hashable description of what *action_key* acted on."""
+    if info is None:
+        return None
+    if isinstance(info, dict):
+        return (info.get("number"), info.get("content"))
+    return tuple(info)
+
+
+class LoopDetector:
+    def __init__(self, window=3):
+        self.window = window
+        self.history = []
+        self.loops_detected = 0
+
+    def observe(self, action_key, info, fingerprint):
+        """Record one step; return the repeat count when the last *window* steps are identical, else 0."""
+        step = (action_key, action_target(action_key, info), fingerprint)
+        self.history.append(step)
+        if fingerprint is None or len(self.history) < self.window:
+            return 0
+        if all(s == step for s in self.history[-self.window:]):
+            repeat = 0
+            for s in reversed(self.history):
+                if s != step:
+                    break
+                repeat += 1
+            self.loops_detected += 1
+            logging.warning("Loop detected: %s repeated %s times", step[:2], repeat)
+            return repeat
+        return 0
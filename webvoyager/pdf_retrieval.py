@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter
+
+
+# Local alternative to get_pdf_retrieval_ans_from_assistant: extract the text
+# of a downloaded PDF, split it into overlapping word chunks and rank them with
+# BM25 against the task. Works with endpoints that don't implement the
+# Assistants API and needs no network round trips. Extracted chunks are cached
+# by the SHA-256 of the PDF, so the same file is only parsed once.
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def extract_pdf_text(pdf_path):
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise ImportError("Local PDF retrieval requires pypdf: pip install pypdf") from e
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page in reader.pages:
+        try:
+            pages.append(page.extract_text() or "")
+        except Exception as e:  # pylint: disable=broad-except
+            logging.warning("Failed to extract a PDF page: %s", e)
+    return "\n".join(pages)
+
+
+def chunk_text(text, chunk_words=200, overlap=50):
+    words = text.split()
+    if not words:
+        return []
+    step = max(chunk_words - overlap, 1)
+    return [" ".join(words[i:i + chunk_words]) for i in range(0, max(len(words) - overlap, 1), step)]
+
+
+def bm25_rank(chunks, query, top_k=3, k1=1.5, b=0.75):
+    """Return the *top_k* (score, chunk) pairs for *query*, best first."""
+    docs = [Counter(tokenize(chunk)) for chunk in chunks]
+    if not docs:
+        return []
+    doc_lens = [sum(doc.values()) for doc in docs]
+    avg_len = sum(doc_lens) / len(docs) or 1.0
+    df = Counter()
+    for doc in docs:
+        df.update(doc.keys())
+    n_docs = len(docs)
+    query_terms = set(tokenize(query))
+
+    scored = []
+    for chunk, doc, doc_len in zip(chunks, docs, doc_lens):
+        score = 0.0
+        for term in query_terms:
+            tf = doc.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / avg_len))
+        scored.append((score, chunk))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored[:top_k]
+
+
+def load_pdf_chunks(pdf_path, cache_dir=None, chunk_words=200, overlap=50):
+    with open(pdf_path, "rb") as f:
+        pdf_hash = hashlib.sha256(f.read()).hexdigest()
+    cache_file = None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_file = os.path.join(cache_dir, f"{pdf_hash}_{chunk_words}_{overlap}.json")
+        if os.path.isfile(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+    chunks = chunk_text(extract_pdf_text(pdf_path), chunk_words, overlap)
+    if cache_file:
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        os.replace(tmp_file, cache_file)
+    return chunks
+
+
+def get_pdf_retrieval_ans_local(pdf_path, task, cache_dir=None, top_k=3):
+    logging.info("Retrieving from PDF %s locally.", pdf_path)
+    chunks = load_pdf_chunks(pdf_path, cache_dir)
+    if not chunks:
+        return "No text could be extracted from the PDF file."
+    ranked = [chunk for score, chunk in bm25_rank(chunks, task, top_k) if score > 0]
+    if not ranked:
+        ranked = chunks[:1]
+    return " ".join(f"[Excerpt {i + 1}] {chunk}" for i, chunk in enumerate(ranked))
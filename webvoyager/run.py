@@ -1,3 +1,4 @@
+import base64
 import platform
 import argparse
 import time
@@ -18,14 +19,20 @@ from prompts import SYSTEM_PROMPT, SYSTEM_PROMPT_TEXT_ONLY
 from openai import OpenAI
 from utils import (
     get_web_element_rect,
-    encode_image,
     extract_information,
     print_message,
     get_webarena_accessibility_tree,
     get_pdf_retrieval_ans_from_assistant,
     clip_message_and_obs,
     clip_message_and_obs_text_only,
+    get_dom_hash,
+    get_observation_fingerprint,
+    UNCHANGED_OBS_MARKER,
 )
+from image_diff import diff_images
+from download_watcher import DownloadWatcher
+from pdf_retrieval import get_pdf_retrieval_ans_local
+from loop_detector import LoopDetector, LOOP_POLICIES, loop_warn_template
 from datetime import datetime
 
 # ────────────────────────────────────────────────────────────────────────────────
@@ -55,7 +62,7 @@ def setup_logger(folder_path: str):
 # Selenium / browser configuration
 # ────────────────────────────────────────────────────────────────────────────────
 
-def driver_config(args: argparse.Namespace) -> webdriver.ChromeOptions:
+def driver_config(args: argparse.Namespace, download_dir: str = None) -> webdriver.ChromeOptions:
     options = webdriver.ChromeOptions()
 
     if args.save_accessibility_tree:
@@ -71,7 +78,7 @@ def driver_config(args: argparse.Namespace) -> webdriver.ChromeOptions:
     options.add_experimental_option(
         "prefs",
         {
-            "download.default_directory": args.download_dir,
+            "download.default_directory": os.path.abspath(download_dir or args.download_dir),
             "plugins.always_open_pdf_externally": True,
         },
     )
@@ -145,6 +152,32 @@ def format_msg(it, init_msg, pdf_obs, warn_obs, web_img_b64, web_text):
         return curr_msg
 
 
+def format_msg_no_change(warn_obs):
+    # Sent instead of format_msg when the screenshot is pixel-identical to the
+    # previous one, so the last attached image and its element list stay the
+    # reference. Plain-string turns are never clipped, so nothing large goes here.
+    return {
+        "role": "user",
+        "content": (
+            f"Observation:{warn_obs} no visual change; the page looks exactly the same as in the previous screenshot, "
+            "so neither the screenshot nor the element list is attached again. "
+            "Your last action probably had no effect; consider choosing a different element or action."
+        ),
+    }
+
+
+def format_msg_collapsed(warn_obs, repeat):
+    # Cheapest turn: DOM and screenshot are byte-identical to the previous
+    # observation, so neither the image nor the element list is resent.
+    return {
+        "role": "user",
+        "content": (
+            f"Observation:{warn_obs} {UNCHANGED_OBS_MARKER} for {repeat} consecutive step(s); "
+            "the previous observation still applies. Your last action had no effect, please choose a different element or action."
+        ),
+    }
+
+
 def format_msg_text_only(it, init_msg, pdf_obs, warn_obs, ac_tree):
     if it == 1:
         init_msg_format = {
@@ -213,7 +246,6 @@ def call_gpt4v_api(args, openai_client, messages):
 def exec_action_click(info, web_ele, driver_task):
     driver_task.execute_script("arguments[0].setAttribute('target', '_self')", web_ele)
     web_ele.click()
-    time.sleep(3)
 
 
 def exec_action_type(info, web_ele, driver_task):
@@ -287,6 +319,28 @@ def exec_action_scroll(info, web_eles, driver_task, args, obs_info):
     time.sleep(3)
 
 
+def retrieve_from_pdf(args, client, pdf_path, question):
+    if args.pdf_retrieval == "assistant":
+        try:
+            answer = get_pdf_retrieval_ans_from_assistant(client, pdf_path, question)
+            return (
+                "You downloaded a PDF file, I ask the Assistant API to answer the task based on the PDF file and get the following response: "
+                + answer
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            logging.warning("Assistant API retrieval failed (%s), falling back to local retrieval", e)
+    try:
+        excerpts = get_pdf_retrieval_ans_local(pdf_path, question, cache_dir=args.pdf_cache_dir)
+    except Exception as e:  # pylint: disable=broad-except
+        # the click that downloaded the PDF worked, so this must not look like a failed action
+        logging.error("Could not read the downloaded PDF %s: %s", pdf_path, e)
+        return "You downloaded a PDF file, but the downloaded PDF could not be read, so its content is not available."
+    return (
+        "You downloaded a PDF file, I extracted the passages most relevant to the task from it: "
+        + excerpts
+    )
+
+
 # Prompt shown when max iterations reached
 ui_limit_prompt_template = (
     "You have reached the maximum number of allowed interactions with the website.\n\n"
@@ -319,9 +373,26 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
     # Per‑process OpenAI client
     client = OpenAI(api_key=args.api_key, base_url="http://PI_ADDRESS:PORT/v1")
 
-    options = driver_config(args)
+    # Each task downloads into its own folder so parallel workers never see
+    # each other's files.
+    task_download_dir = os.path.join(args.download_dir, f"task{task['id']}")
+    if os.path.isdir(task_download_dir):
+        shutil.rmtree(task_download_dir)
+    os.makedirs(task_download_dir, exist_ok=True)
+
+    options = driver_config(args, task_download_dir)
     driver_task = webdriver.Chrome(options=options)
     driver_task.set_window_size(args.window_width, args.window_height)
+    try:
+        driver_task.execute_cdp_cmd(
+            "Browser.setDownloadBehavior",
+            {"behavior": "allow", "downloadPath": os.path.abspath(task_download_dir)},
+        )
+    except Exception as e:
+        logging.warning(
+            "Browser.setDownloadBehavior failed (%s); downloads may not land in %s and the download watcher may time out",
+            e, task_download_dir,
+        )
 
     try:
         driver_task.get(task["web"])
@@ -340,15 +411,15 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
     )
     time.sleep(5)
 
-    os.makedirs(args.download_dir, exist_ok=True)
-
-    # Ensure download dir empty for this task
-    for f in os.listdir(args.download_dir):
-        fp = os.path.join(args.download_dir, f)
-        if os.path.isfile(fp):
-            os.remove(fp)
-
-    download_files: List[str] = []
+    download_watcher = DownloadWatcher(task_download_dir)
+    prev_img_path = None
+    fingerprint = None
+    prev_fingerprint = None
+    unchanged_streak = 0
+    track_fingerprint = args.collapse_identical_obs or args.loop_policy != "off"
+    loop_detector = LoopDetector(window=args.loop_window)
+    force_verdict = False
+    termination_reason = "max_iter"
     fail_obs = ""
     pdf_obs = ""
     warn_obs = ""
@@ -377,7 +448,7 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
         logging.info("Iter: %s", it)
         it += 1
 
-        if it == args.max_iter:
+        if it == args.max_iter or force_verdict:
             curr_msg = {
                 "role": "user",
                 "content": ui_limit_prompt_template.format(expected_result=task["expected_result"]),
@@ -385,6 +456,12 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
             messages.append(curr_msg)
         elif not fail_obs:
             try:
+                clean_png = None
+                if track_fingerprint:
+                    dom_hash = get_dom_hash(driver_task)
+                    if not args.text_only and not args.fix_box_color:
+                        # random box colors would make every screenshot unique; fingerprint the page without overlays
+                        clean_png = driver_task.get_screenshot_as_png()
                 if not args.text_only:
                     rects, web_eles, web_eles_text = get_web_element_rect(
                         driver_task, fix_color=args.fix_box_color
@@ -396,18 +473,45 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
                     )
             except Exception as e:
                 logging.error("Driver error when capturing page: %s", e)
+                termination_reason = "driver_error"
                 break
 
             img_path = os.path.join(task_dir, f"screenshot{it}.png")
-            driver_task.save_screenshot(img_path)
+            screenshot_png = driver_task.get_screenshot_as_png()
+            with open(img_path, "wb") as fw:
+                fw.write(screenshot_png)
 
             if (not args.text_only) and args.save_accessibility_tree:
                 accessibility_tree_path = os.path.join(task_dir, f"accessibility_tree{it}")
                 get_webarena_accessibility_tree(driver_task, accessibility_tree_path)
 
-            b64_img = encode_image(img_path)
-
-            if not args.text_only:
+            collapsed = False
+            if track_fingerprint:
+                fingerprint = get_observation_fingerprint(dom_hash, clean_png or screenshot_png)
+            if args.collapse_identical_obs:
+                collapsed = fingerprint == prev_fingerprint and not pdf_obs
+                unchanged_streak = unchanged_streak + 1 if collapsed else 0
+                prev_fingerprint = fingerprint
+                if collapsed:
+                    logging.info("Observation unchanged (%s), collapsing", fingerprint)
+
+            unchanged = False
+            if args.skip_unchanged_screenshot and (not args.text_only) and prev_img_path and not pdf_obs and not collapsed:
+                # full resolution, no tolerance: a single changed digit or checkbox must still be sent
+                diff = diff_images(prev_img_path, img_path, scale=1, pixel_tol=0, stop_ratio=0)
+                unchanged = not diff["changed"]
+                logging.info(
+                    "Screenshot diff vs previous: changed_ratio=%.5f boxes=%s",
+                    diff["changed_ratio"], diff["boxes"][:5],
+                )
+            prev_img_path = img_path
+
+            if collapsed:
+                curr_msg = format_msg_collapsed(warn_obs, unchanged_streak)
+            elif unchanged:
+                curr_msg = format_msg_no_change(warn_obs)
+            elif not args.text_only:
+                b64_img = base64.b64encode(screenshot_png).decode("utf-8")
                 curr_msg = format_msg(
                     it, init_msg, pdf_obs, warn_obs, b64_img, web_eles_text
                 )
@@ -430,12 +534,16 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
             args, client, messages
         )
         if gpt_call_error:
+            termination_reason = "api_error"
             break
         accumulate_prompt_token += prompt_tokens
         accumulate_completion_token += completion_tokens
         gpt_4v_res = openai_response.choices[0].message.content
         messages.append({"role": "assistant", "content": gpt_4v_res})
 
+        if force_verdict:
+            break
+
         # Remove overlay rectangles
         if (not args.text_only) and "rects" in locals() and rects:
             for rect_ele in rects:
@@ -456,6 +564,19 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
         pdf_obs = ""
         warn_obs = ""
 
+        if args.loop_policy != "off" and action_key != "answer" and it < args.max_iter:
+            repeat = loop_detector.observe(action_key, info, fingerprint)
+            if repeat and args.loop_policy == "stop":
+                termination_reason = "loop_stop"
+                break
+            if repeat and args.loop_policy == "verdict":
+                # Skip the repeated action and ask for the final verdict now.
+                termination_reason = "loop_verdict"
+                force_verdict = True
+                continue
+            if repeat:
+                warn_obs = " " + loop_warn_template.format(action=chosen_action, repeat=repeat)
+
         try:
             driver_task.switch_to.window(driver_task.current_window_handle)
 
@@ -477,25 +598,13 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
                     )
                 exec_action_click(info, web_ele, driver_task)
 
-                # Check for PDF downloads
-                current_files = sorted(os.listdir(args.download_dir))
-                if current_files != download_files:
-                    time.sleep(10)  # wait for download
-                    current_files = sorted(os.listdir(args.download_dir))
-                    new_pdfs = [
-                        pdf for pdf in current_files if pdf not in download_files and pdf.endswith(".pdf")
-                    ]
-                    if new_pdfs:
-                        pdf_file = new_pdfs[0]
-                        pdf_obs = get_pdf_retrieval_ans_from_assistant(
-                            client, os.path.join(args.download_dir, pdf_file), task["ques"]
-                        )
-                        shutil.copy(os.path.join(args.download_dir, pdf_file), task_dir)
-                        pdf_obs = (
-                            "You downloaded a PDF file, I ask the Assistant API to answer the task based on the PDF file and get the following response: "
-                            + pdf_obs
-                        )
-                    download_files[:] = current_files
+                # Check for PDF downloads; the start grace period also gives the page time to react to the click
+                new_files = download_watcher.wait_for_downloads(timeout=args.download_timeout, start_timeout=3)
+                new_pdfs = [pdf for pdf in new_files if pdf.endswith(".pdf")]
+                if new_pdfs:
+                    pdf_path = os.path.join(task_download_dir, new_pdfs[0])
+                    pdf_obs = retrieve_from_pdf(args, client, pdf_path, task["ques"])
+                    shutil.copy(pdf_path, task_dir)
 
             elif action_key == "wait":
                 time.sleep(5)
@@ -516,7 +625,7 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
                         element_box_center[0],
                         element_box_center[1],
                     )
-                warn_obs = exec_action_type(info, web_ele, driver_task)
+                warn_obs = exec_action_type(info, web_ele, driver_task) + warn_obs
                 if "wolfram" in task["web"]:
                     time.sleep(5)
 
@@ -536,6 +645,7 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
 
             elif action_key == "answer":
                 logging.info(info["content"])
+                termination_reason = "answer"
                 break  # finished!
 
             else:
@@ -554,8 +664,23 @@ def run_single_task(task: Dict[str, Any], args_dict: Dict[str, Any]):
         "Total cost: %.4f",
         accumulate_prompt_token / 1000 * 0.01 + accumulate_completion_token / 1000 * 0.03,
     )
+    download_watcher.close()
     driver_task.quit()
 
+    run_stats = {
+        "termination_reason": termination_reason,
+        "iterations": it,
+        "max_iter": args.max_iter,
+        "iterations_saved": args.max_iter - it if termination_reason.startswith("loop_") else 0,
+        "loops_detected": loop_detector.loops_detected,
+        "prompt_tokens": accumulate_prompt_token,
+        "completion_tokens": accumulate_completion_token,
+    }
+    logging.info("Run stats: %s", run_stats)
+    with open(os.path.join(task_dir, "run_stats.json"), "w", encoding="utf-8") as fw:
+        json.dump(run_stats, fw, indent=2)
+    return run_stats
+
 
 # ────────────────────────────────────────────────────────────────────────────────
 # Orchestrator – run tasks in parallel
@@ -572,6 +697,20 @@ def main():
     parser.add_argument("--max_attached_imgs", type=int, default=1)
     parser.add_argument("--temperature", type=float, default=1.0)
     parser.add_argument("--download_dir", type=str, default="downloads")
+    parser.add_argument(
+        "--download_timeout",
+        type=int,
+        default=60,
+        help="Max seconds to wait for a started download to complete",
+    )
+    parser.add_argument(
+        "--pdf_retrieval",
+        type=str,
+        default="assistant",
+        choices=["assistant", "local"],
+        help="Answer from downloaded PDFs with the Assistants API (falls back to local on error) or with local BM25 retrieval",
+    )
+    parser.add_argument("--pdf_cache_dir", type=str, default="pdf_cache")
     parser.add_argument("--text_only", action="store_true")
 
     # Browser args
@@ -581,6 +720,25 @@ def main():
     parser.add_argument("--window_width", type=int, default=1024)
     parser.add_argument("--window_height", type=int, default=768)
     parser.add_argument("--fix_box_color", action="store_true")
+    parser.add_argument(
+        "--skip_unchanged_screenshot",
+        action="store_true",
+        help="Send a text-only 'no visual change' observation when the screenshot is pixel-identical to the previous one (use with --fix_box_color)",
+    )
+    parser.add_argument(
+        "--collapse_identical_obs",
+        action="store_true",
+        help="Replace an observation whose DOM and screenshot are identical to the previous one with a short text-only 'unchanged' turn "
+        "(without --fix_box_color an extra screenshot is taken before the boxes are drawn)",
+    )
+    parser.add_argument(
+        "--loop_policy",
+        type=str,
+        default="off",
+        choices=LOOP_POLICIES,
+        help="What to do when the same action is repeated on an unchanged page: warn the model, ask for the final verdict early, or stop",
+    )
+    parser.add_argument("--loop_window", type=int, default=3, help="Identical consecutive steps that count as a loop")
 
     # Parallelism
     parser.add_argument(
@@ -605,6 +763,7 @@ def main():
         return
 
     args_dict = vars(args)  # pickle‑friendly
+    all_stats: List[Dict[str, Any]] = []
 
     with ProcessPoolExecutor(max_workers=args.num_workers) as executor:
         future_to_task = {
@@ -613,11 +772,24 @@ def main():
         for future in as_completed(future_to_task):
             task = future_to_task[future]
             try:
-                future.result()
+                run_stats = future.result()
+                if run_stats:
+                    all_stats.append(run_stats)
                 print(f"Task {task['id']} completed successfully.")
             except Exception as exc:
                 print(f"Task {task['id']} generated an exception: {exc}")
 
+    if all_stats:
+        reasons: Dict[str, int] = {}
+        for stats in all_stats:
+            reasons[stats["termination_reason"]] = reasons.get(stats["termination_reason"], 0) + 1
+        print(f"Termination reasons: {reasons}")
+        print(
+            f"Iterations used: {sum(s['iterations'] for s in all_stats)}, "
+            f"saved by loop detection: {sum(s['iterations_saved'] for s in all_stats)}, "
+            f"loops detected: {sum(s['loops_detected'] for s in all_stats)}"
+        )
+
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,10 @@
 import base64
+import hashlib
 import re
 import os
 import json
 import time
 import logging
-import numpy as np
 from PIL import Image
 from utils_webarena import fetch_browser_info, fetch_page_accessibility_tree,\
                     parse_accessibility_tree, clean_accesibility_tree
@@ -279,12 +279,17 @@ def clip_message_and_obs(msg, max_img_num):
     return clipped_msg
 
 
+# Collapsed "nothing changed" observations carry no tree, so clipping must not
+# count them against max_tree_num.
+UNCHANGED_OBS_MARKER = "the page is unchanged (identical DOM and screenshot)"
+
+
 def clip_message_and_obs_text_only(msg, max_tree_num):
     clipped_msg = []
     tree_num = 0
     for idx in range(len(msg)):
         curr_msg = msg[len(msg) - 1 - idx]
-        if curr_msg['role'] != 'user':
+        if curr_msg['role'] != 'user' or UNCHANGED_OBS_MARKER in curr_msg['content']:
             clipped_msg = [curr_msg] + clipped_msg
         else:
             if tree_num < max_tree_num:
@@ -345,61 +350,85 @@ def get_webarena_accessibility_tree(browser, save_file=None):
     return content, obs_nodes_info
 
 
-def compare_images(img1_path, img2_path):
-    img1 = Image.open(img1_path)
-    img2 = Image.open(img2_path)
-
-    img1_array = np.asarray(img1)
-    img2_array = np.asarray(img2)
-
-    difference = np.abs(img1_array - img2_array)
+def get_dom_hash(browser):
+    # Hash of the serialized DOM plus URL and scroll offset, taken before the
+    # element overlays are drawn so box colors do not affect it.
+    dom = browser.execute_script(
+        "return [location.href, window.scrollX, window.scrollY, document.documentElement.outerHTML];"
+    )
+    return hashlib.sha1(json.dumps(dom).encode('utf-8')).hexdigest()
 
-    total_difference = np.sum(difference)
 
-    return total_difference
+def get_observation_fingerprint(dom_hash, screenshot_png):
+    # screenshot_png must not carry randomly colored element boxes, or no two
+    # observations ever match.
+    return dom_hash + ':' + hashlib.sha1(screenshot_png).hexdigest()
 
 
-def get_pdf_retrieval_ans_from_assistant(client, pdf_path, task):
+def get_pdf_retrieval_ans_from_assistant(client, pdf_path, task, timeout=180, max_delay=8):
+    # Raises when the run does not complete, so callers can fall back to local retrieval.
     # print("You download a PDF file that will be retrieved using the Assistant API.")
     logging.info("You download a PDF file that will be retrieved using the Assistant API.")
-    file = client.files.create(
-        file=open(pdf_path, "rb"),
-        purpose='assistants'
-    )
-    # print("Create assistant...")
-    logging.info("Create assistant...")
-    assistant = client.beta.assistants.create(
-        instructions="You are a helpful assistant that can analyze the content of a PDF file and give an answer that matches the given task, or retrieve relevant content that matches the task.",
-        model="gpt-4-1106-preview",
-        tools=[{"type": "retrieval"}],
-        file_ids=[file.id]
-    )
-    thread = client.beta.threads.create()
-    message = client.beta.threads.messages.create(
-        thread_id=thread.id,
-        role="user",
-        content=task,
-        file_ids=[file.id]
-    )
-    run = client.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=assistant.id
-    )
-    while True:
-        # Retrieve the run status
-        run_status = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-        if run_status.status == 'completed':
-            break
-        time.sleep(2)
-    messages = client.beta.threads.messages.list(thread_id=thread.id)
-    messages_text = messages.data[0].content[0].text.value
-    file_deletion_status = client.beta.assistants.files.delete(
-        assistant_id=assistant.id,
-        file_id=file.id
-    )
-    # print(file_deletion_status)
-    logging.info(file_deletion_status)
-    assistant_deletion_status = client.beta.assistants.delete(assistant.id)
-    # print(assistant_deletion_status)
-    logging.info(assistant_deletion_status)
-    return messages_text
+    with open(pdf_path, "rb") as f:
+        file = client.files.create(
+            file=f,
+            purpose='assistants'
+        )
+    assistant = None
+    try:
+        # print("Create assistant...")
+        logging.info("Create assistant...")
+        assistant = client.beta.assistants.create(
+            instructions="You are a helpful assistant that can analyze the content of a PDF file and give an answer that matches the given task, or retrieve relevant content that matches the task.",
+            model="gpt-4-1106-preview",
+            tools=[{"type": "retrieval"}],
+            file_ids=[file.id]
+        )
+        thread = client.beta.threads.create()
+        message = client.beta.threads.messages.create(
+            thread_id=thread.id,
+            role="user",
+            content=task,
+            file_ids=[file.id]
+        )
+        run = client.beta.threads.runs.create(
+            thread_id=thread.id,
+            assistant_id=assistant.id
+        )
+        # Poll with bounded exponential backoff: quick answers return fast, slow
+        # ones don't hammer the API, and a stuck run cannot hang the task.
+        delay = 0.5
+        deadline = time.monotonic() + timeout
+        while True:
+            # Retrieve the run status
+            run_status = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+            if run_status.status in ('completed', 'failed', 'cancelled', 'expired'):
+                break
+            if time.monotonic() + delay > deadline:
+                try:
+                    client.beta.threads.runs.cancel(thread_id=thread.id, run_id=run.id)
+                except Exception as e:
+                    logging.info("Failed to cancel run: %s", e)
+                raise TimeoutError(f"Assistant run {run.id} did not finish within {timeout}s")
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+        if run_status.status != 'completed':
+            raise RuntimeError(f"Assistant run {run.id} ended with status {run_status.status}")
+        messages = client.beta.threads.messages.list(thread_id=thread.id)
+        return messages.data[0].content[0].text.value
+    finally:
+        try:
+            if assistant is not None:
+                file_deletion_status = client.beta.assistants.files.delete(
+                    assistant_id=assistant.id,
+                    file_id=file.id
+                )
+                # print(file_deletion_status)
+                logging.info(file_deletion_status)
+                assistant_deletion_status = client.beta.assistants.delete(assistant.id)
+                # print(assistant_deletion_status)
+                logging.info(assistant_deletion_status)
+            else:
+                client.files.delete(file.id)
+        except Exception as e:
+            logging.info("Failed to clean up Assistant API resources: %s", e)